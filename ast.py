@@ -3,7 +3,9 @@ This is the CLI entry for ast
 """
 import textwrap
 import os
-from ast import ast, expr, lat
+import sys
+from ast import ast, expr, lat, stream
+from ast.excepts import EvaluationException
 
 
 def main():
@@ -28,11 +30,33 @@ def main():
         help="Generate and open the PDF of the math expression",
         required=False,
         action="store_true")
+    parser.add_argument("-c", "--csv",
+        help="Evaluate the expression for each row of the CSV file, the variables are the columns",
+        required=False,
+        metavar="file")
+    parser.add_argument("-o", "--output",
+        help="Write the rows and the results of --csv to the file instead of the console",
+        required=False,
+        metavar="file")
     args = parser.parse_args()
     if args.eval is not None:
         exp = args.eval
         a = ast.build(exp)
-        if expr.is_evaluable(exp):
+        if args.csv is not None:
+            try:
+                with open(args.csv, newline="") as source:
+                    if args.output is None:
+                        info = stream.evaluate_csv(a, source, sys.stdout)
+                    else:
+                        with open(args.output, "w", newline="") as target:
+                            info = stream.evaluate_csv(a, source, target)
+            except EvaluationException as e:
+                sys.exit("%s: %s" % (args.csv, e))
+            for line, message in info["errors"]:
+                print("Line %d: %s" % (line, message), file=sys.stderr)
+            print("%d rows in %.3f seconds (%.0f rows/second)" %
+                  (info["rows"], info["seconds"], info["rows_per_second"]), file=sys.stderr)
+        elif expr.is_evaluable(exp):
             print(ast.evaluate(a))
         else:
             print("Expression not evaluable: "+exp)
@@ -9,35 +9,119 @@ from queue import Queue
 from .excepts import *
 from .expr import *
 from .lat import *
+from .lru import lru
+from .compiler import compile, _postorder
+from .optimize import fold, specialize
 from .binarytree import build as binarytreebuild
 import sys
 import os
+import math
 import textwrap
 
 
 class node():
-    "A node in the AST"
+    """
+    A node in the AST. The symbol is classified once when it is set, see
+    `classify`, so that `kind`, `fn` (the function of operators and
+    functions) and `value` (the value of numbers and special numbers)
+    are ready for evaluation. Please notice that functions are resolved
+    from the mappers at that time.
+
+    Nodes are hashed and compared by the structure of their subtrees, the
+    symbols at each place. The hash of each subtree is computed once and
+    kept until the symbol or a child of a node below it is set. The hashes
+    are dropped through the `parent` links, which are set when a child is
+    given to a node, so a node should only be in one tree at a time.
+    """
+    __slots__ = ("_sym", "kind", "fn", "value", "parent", "_left", "_right", "_hash")
+
     def __init__(self, sym, parent=None, left=None, right=None):
-        self.sym = sym
-        self.left = left
+        self._hash = None
+        self._sym = sym
+        self.kind, self.fn, self.value = classify(sym)
+        self._left = left
         self.parent = parent
-        self.right = right
+        self._right = right
+        if left is not None:
+            left.parent = self
+        if right is not None:
+            right.parent = self
+
+    @property
+    def sym(self):
+        return self._sym
+
+    @sym.setter
+    def sym(self, sym):
+        self._sym = sym
+        self.kind, self.fn, self.value = classify(sym)
+        self._invalidate()
+
+    @property
+    def left(self):
+        return self._left
+
+    @left.setter
+    def left(self, n):
+        self._left = n
+        if n is not None:
+            n.parent = self
+        self._invalidate()
+
+    @property
+    def right(self):
+        return self._right
+
+    @right.setter
+    def right(self, n):
+        self._right = n
+        if n is not None:
+            n.parent = self
+        self._invalidate()
+
+    def __hash__(self):
+        if self._hash is None:
+            _hash_subtree(self)
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, node):
+            return NotImplemented
+        return _equal(self, other)
     
     def is_leaf(self):
         """
         Return True if this is a leaf(i.e. with no children),
         False otherwise.
         """
-        return self.left is None and self.right is None
+        return self._left is None and self._right is None
     
     def copy(self):
         """
         Make a shallow copy of this node, return a new node that
         have the same members with this node. Please notice that
         the new node's parent and children are not being copied,
-        only pointing to them directly.
+        only pointing to them directly, so changes below the new
+        node do not drop its hash.
         """
-        return node(self.sym, self.parent, self.left, self.right)
+        n = node.__new__(node)
+        n._sym = self._sym
+        n.kind = self.kind
+        n.fn = self.fn
+        n.value = self.value
+        n.parent = self.parent
+        n._left = self._left
+        n._right = self._right
+        n._hash = self._hash
+        return n
+
+    def _invalidate(self):
+        "Drop the hashes of this node and its ancestors"
+        n = self
+        # The ancestors of a node without a hash have no hash either
+        while n is not None and n._hash is not None:
+            n._hash = None
+            n = n.parent
 
 
 class astree():
@@ -48,8 +132,9 @@ class astree():
 
     If one wants to construct AST with infix expression, please convert
     it using `postfix` method first, and then pop elements from the stack
-    in order to add them into the tree. Or use `build` directly, which
-    supports more functions such as parathensis and so on.
+    in order to add them into the tree, or pass them to `from_postfix`.
+    Or use `build` directly, which supports more functions such as
+    parathensis and so on.
     
     After constructing the tree completely, one can use `preorder`, `inorder`
     and `postorder` to convert the expression to prefix, infix and postfix format.
@@ -57,6 +142,23 @@ class astree():
     def __init__(self, root=None):
         self.root = root
         self.cur = None
+        # Functions and variables of the tree for the result cache, see `_tree_key`
+        self._key = None
+
+    def __hash__(self):
+        return hash(self.root)
+
+    def __eq__(self, other):
+        """
+        Return True if the other tree has the same symbols at the same
+        places. The cached hashes of the subtrees are compared first, so
+        trees that differ are usually told apart without walking them.
+        """
+        if not isinstance(other, astree):
+            return NotImplemented
+        if self.root is None or other.root is None:
+            return self.root is other.root
+        return _equal(self.root, other.root)
     
     def add(self, sym):
         """
@@ -66,6 +168,7 @@ class astree():
         ---
         `sym` Symbol in string
         """
+        self._key = None
         if self.root is None:
             self.root = node(sym, None)
             self.cur = self.root
@@ -100,6 +203,41 @@ class astree():
                         self.cur = self.cur.parent
                     self.cur.left = node(sym, self.cur)
 
+    @classmethod
+    def from_postfix(cls, tokens):
+        """
+        Construct a new AST from symbols in POSTFIX order, such as the
+        result of `postfix`. Unlike `add`, the symbols are consumed from
+        the first to the last with a stack of operands, and each operator
+        or function pops as many operands as it takes, so the tree is
+        built in linear time. Raise `ParseException` if symbols are left
+        without an operator to join them.
+
+        @param
+        ---
+        `tokens` List of symbols in string
+        """
+        stack = []
+        for sym in tokens:
+            if is_operator(sym) or is_func(sym):
+                right = stack.pop() if len(stack) > 0 else None
+                left = None
+                if not is_unary(sym) and len(stack) > 0:
+                    left = stack.pop()
+                n = node(sym, None, left, right)
+                if left is not None:
+                    left.parent = n
+                if right is not None:
+                    right.parent = n
+                stack.append(n)
+            else:
+                stack.append(node(sym))
+        if len(stack) > 1:
+            raise ParseException("Missing operator in: " + " ".join(tokens))
+        tree = cls(stack[0] if len(stack) > 0 else None)
+        tree.cur = tree.root
+        return tree
+
     def bfs(self):
         """
         Travel the tree in `breadth first search` way, which is from left to
@@ -123,14 +261,16 @@ class astree():
         the symbols.
         """
         li = []
-        def travel(node):
-            if node is not None:
-                travel(node.left)
-                li.append(node.sym)
-                print(node.sym, end=" ")
-                travel(node.right)
-        print()
-        travel(self.root)
+        stack = []
+        n = self.root
+        while n is not None or len(stack) > 0:
+            while n is not None:
+                stack.append(n)
+                n = n.left
+            n = stack.pop()
+            li.append(n.sym)
+            n = n.right
+        _print_syms(li)
         return li
     
     def preorder(self):
@@ -139,14 +279,14 @@ class astree():
         the symbols.
         """
         li = []
-        def travel(node):
-            if node is not None:
-                print(node.sym, end=" ")
-                li.append(node.sym)
-                travel(node.left)
-                travel(node.right)
-        print()
-        travel(self.root)
+        stack = [self.root]
+        while len(stack) > 0:
+            n = stack.pop()
+            if n is not None:
+                li.append(n.sym)
+                stack.append(n.right)
+                stack.append(n.left)
+        _print_syms(li)
         return li
     
     def postorder(self):
@@ -155,14 +295,15 @@ class astree():
         the symbols.
         """
         li = []
-        def travel(node):
-            if node is not None:
-                travel(node.left)
-                travel(node.right)
-                print(node.sym, end=" ")
-                li.append(node.sym)
-        print()
-        travel(self.root)
+        stack = [self.root]
+        while len(stack) > 0:
+            n = stack.pop()
+            if n is not None:
+                li.append(n.sym)
+                stack.append(n.left)
+                stack.append(n.right)
+        li.reverse()
+        _print_syms(li)
         return li
     
     def copy(self):
@@ -185,6 +326,9 @@ def evaluate(a, vars={}):
     be substituted when evaluating the result. If there
     are variables in the tree but no corresponding values
     are provided, it will raise `EvaluationException`.
+    If the result cache is enabled by `enable_result_cache`,
+    results of the same tree with the same values of the
+    variables are returned from the cache.
 
     @param
     ---
@@ -192,27 +336,44 @@ def evaluate(a, vars={}):
 
     `vars={}` The variables dict, for example: `{"x": 10, "y": 12}` 
     """
-    def _eval(node):
-        if node is None:
-            return 0
-        if is_unary(node.sym):
-            return function_mapper[node.sym](_eval(node.right))
-        if is_number(node.sym):
-            return float(node.sym)
-        if is_special_number(node.sym):
-            return special_number[node.sym]
-        if is_var(node.sym):
-            if node.sym in vars:
-                return float(vars[node.sym])
+    if _results is not None:
+        key = _tree_key(a, vars)
+        if key is not None:
+            value = _results.get(key, _MISSING)
+            if value is _MISSING:
+                value = _evaluate(a, vars)
+                _results.put(key, value)
+            return value
+    return _evaluate(a, vars)
+
+
+def _evaluate(a, vars):
+    "Evaluate the result of the given AST without the result cache"
+    values = []
+    for n in _postorder(a.root):
+        if n is None:
+            values.append(0)
+            continue
+        kind = n.kind
+        if kind == NODE_BINARY:
+            right = values.pop()
+            values[-1] = n.fn(values[-1], right)
+        elif kind == NODE_UNARY:
+            values[-1] = n.fn(values[-1])
+        elif kind == NODE_CONST:
+            values.append(n.value)
+        elif kind == NODE_VAR:
+            if n.sym in vars:
+                values.append(float(vars[n.sym]))
             else:
-                raise EvaluationException("Undefined variable: " + node.sym)
-        left = _eval(node.left)
-        right = _eval(node.right)
-        return symbols[node.sym](left, right)
-    return _eval(a.root)
+                raise EvaluationException("Undefined variable: " + n.sym)
+        else:
+            right = values.pop()
+            values[-1] = symbols[n.sym](values[-1], right)
+    return values[0]
 
 
-def build(e):
+def build(e, use_postfix=False, fold=False):
     """
     Build and return a `astree` by given INFIX expression. Infix
     expression means expressions that placed operators between
@@ -222,16 +383,206 @@ def build(e):
     also support expressions in general, for example `a+b`.
     However, only math expressions can be evaluated.
 
+    The tree is built by a single pass parser, see `parse`. Raise
+    `ParseException` if brackets, operators or function arguments
+    are missing. If the parse cache is enabled by `enable_cache`,
+    trees of expressions that were built before are copied from
+    the cache instead.
+
     @param
     ---
     `e` The expression in string format
+
+    `use_postfix=False` Build the tree the old way instead, by converting
+    the expression to postfix first, see `astree.from_postfix`
+
+    `fold=False` Fold the subtrees without variables into numbers, see
+    `optimize.fold`
+    """
+    e = "".join(e.split())
+    if _cache is None:
+        return _build(e, use_postfix, fold)
+    grammar = _grammar()
+    if grammar != _cache_grammar[0]:
+        _cache.clear()
+        _cache_grammar[0] = grammar
+    key = (e, use_postfix, fold)
+    tree = _cache.get(key)
+    if tree is None:
+        tree = _build(e, use_postfix, fold)
+        _cache.put(key, tree, _count(tree.root))
+    return tree.copy()
+
+
+def enable_cache(max_entries=1024, max_nodes=None):
+    """
+    Enable the parse cache of `build`, which keeps the trees of the most
+    recently built expressions. Expressions are the same if they only
+    differ in whitespaces. `build` returns a copy of the cached tree, so
+    it is safe to modify the result. The cache is cleared automatically
+    when `symbols`, the function mappers or `special_number` are modified.
+    Enabling the cache again replaces it with an empty one.
+
+    @param
+    ---
+    `max_entries=1024` The maximum number of cached expressions
+
+    `max_nodes=None` The maximum number of nodes of all cached trees
+    """
+    global _cache
+    _cache = lru(max_entries, max_nodes)
+    _cache_grammar[0] = _grammar()
+
+
+def disable_cache():
+    "Disable the parse cache of `build` and drop the cached trees"
+    global _cache
+    _cache = None
+
+
+def clear_cache():
+    "Drop the cached trees of `build`, the counters are kept"
+    if _cache is not None:
+        _cache.clear()
+
+
+def cache_info():
+    """
+    Return a dict with `hits`, `misses`, `evictions`, `entries` and
+    `nodes` of the parse cache, together with its limits `max_entries`
+    and `max_nodes`. Return None if the cache is not enabled.
+    """
+    if _cache is None:
+        return None
+    info = _cache.info()
+    info["nodes"] = info.pop("size")
+    info["max_nodes"] = info.pop("max_size")
+    return info
+
+
+def enable_result_cache(max_entries=1024, ttl=None):
+    """
+    Enable the result cache of `evaluate`, which keeps the results of the
+    most recently evaluated trees with the values of their variables.
+    Trees are the same if they have the same symbols at the same places,
+    so different trees of the same expression share results. A modified
+    tree is looked up again by its new structure, so it never gets the
+    results of its old structure. Errors are not cached. The cached
+    results keep their trees alive until they are evicted.
+    Enabling the cache again replaces it with an empty one.
+
+    @param
+    ---
+    `max_entries=1024` The maximum number of cached results
+
+    `ttl=None` Seconds after which a result expires, results do not expire by default
+    """
+    global _results
+    _results = lru(max_entries, ttl=ttl)
+
+
+def disable_result_cache():
+    "Disable the result cache of `evaluate` and drop the cached results"
+    global _results
+    _results = None
+
+
+def clear_result_cache():
+    "Drop the cached results of `evaluate`, the counters are kept"
+    if _results is not None:
+        _results.clear()
+
+
+def result_cache_info():
+    """
+    Return a dict with `hits`, `misses`, `hit_rate`, `evictions`,
+    `expirations` and `entries` of the result cache, together with its
+    limits `max_entries` and `ttl`. Return None if the cache is not enabled.
     """
-    e = e.replace(" ", "")
-    p = postfix(e)
-    ast = astree()
-    while len(p) > 0:
-        ast.add(p.pop())
-    return ast
+    if _results is None:
+        return None
+    info = _results.info()
+    del info["size"], info["max_size"]
+    return info
+
+
+def parse(e):
+    """
+    Parse the INFIX expression into nodes and return the root node,
+    or None if the expression is empty. The nodes are created directly
+    from the tokens in one pass, by precedence climbing with an explicit
+    operator stack instead of recursion, so deeply nested expressions are
+    fine as well.
+
+    Since ',' is ignored by the tokenizer, an operand that follows another
+    operand inside a function call starts the next argument. Raise
+    `ParseException` if the expression is malformed.
+
+    @param
+    ---
+    `e` The expression in string format
+    """
+    operands = []
+    ops = []
+    expect = True
+    prev = None
+    for kind, start, end in tokenize_spans(e):
+        if kind == TOKEN_NUM or kind == TOKEN_DUMMY:
+            if not expect:
+                _reduce_group(ops, operands)
+            operands.append(node(e[start:end]))
+            expect = False
+        elif kind == TOKEN_FUNC:
+            if not expect:
+                _reduce_group(ops, operands)
+            ops.append((_FUNC, e[start:end], 0))
+            expect = True
+        elif kind == TOKEN_LEFTB:
+            if not expect:
+                _reduce_group(ops, operands)
+            ops.append((_CALL if prev == TOKEN_FUNC else _GROUP, "(", len(operands)))
+            expect = True
+        elif kind == TOKEN_RIGHTB:
+            _reduce_group(ops, operands)
+            if len(ops) == 0:
+                raise ParseException("Unmatched bracket: )")
+            group, _, base = ops.pop()
+            if group == _CALL:
+                _, sym, _ = ops.pop()
+                arity = 1 if is_unary(sym) else 2
+                if len(operands) - base != arity:
+                    raise ParseException("Wrong number of arguments for: " + sym)
+                _apply(_FUNC, sym, operands)
+            elif len(operands) == base:
+                raise ParseException("Empty bracket: ()")
+            elif len(operands) - base > 1:
+                raise ParseException("Missing operator in: " + e)
+            expect = False
+        elif kind == TOKEN_OPER:
+            sym = e[start:end] or "~"
+            if sym == "~":
+                # A negation after an operand starts the next argument, like an operand does
+                if not expect:
+                    _reduce_group(ops, operands)
+                ops.append((_PREFIX, "~", 0))
+                expect = True
+                prev = kind
+                continue
+            if expect:
+                operands.append(None)
+            while len(ops) > 0 and ops[-1][0] < _GROUP and \
+                    (ops[-1][0] == _FUNC or has_precedence(ops[-1][1], sym)):
+                _apply(*ops.pop()[:2], operands)
+            ops.append((_BINARY, sym, 0))
+            expect = True
+        prev = kind
+    while len(ops) > 0:
+        if ops[-1][0] >= _GROUP:
+            raise ParseException("Unmatched bracket: (")
+        _apply(*ops.pop()[:2], operands)
+    if len(operands) > 1:
+        raise ParseException("Missing operator in: " + e)
+    return operands[0] if len(operands) > 0 else None
 
 
 def level_order(ast):
@@ -289,7 +640,7 @@ def subtrees(a, roots=[], max_depth=None):
     `max_depth=None` The maximum depth that this function should reach
     """
     li = []
-    _subtree(a.root, 0, 100, li)
+    _subtree(a.root, 0, max_depth, li)
     result = []
     for tree in li:
         if len(roots) == 0 or tree.root.sym in roots:
@@ -301,73 +652,243 @@ def _level_traversal(root, level, tlist):
     "Travel the tree level by level and save each level in list"
     if root is None:
         return
-
-    if level >= len(tlist):
-        l = []
-        tlist.append(l)
-    tlist[level].append(root.sym)
-    _level_traversal(root.left, level+1, tlist)
-    _level_traversal(root.right, level+1, tlist)
+    current = [root]
+    while len(current) > 0:
+        if level >= len(tlist):
+            tlist.append([])
+        tlist[level].extend(n.sym for n in current)
+        current = [c for n in current for c in (n.left, n.right) if c is not None]
+        level += 1
 
 
 def _subtree(root, depth, max_depth, li):
-    "Recursion of finding subtrees"
-    if root is None or root.is_leaf() or depth == max_depth:
-        return
-    li.append(astree(root))
-    _subtree(root.left, depth+1, max_depth, li)
-    _subtree(root.right, depth+1, max_depth, li)
+    "Collect the subtrees in pre-order until max depth is reached"
+    stack = [(root, depth)]
+    while len(stack) > 0:
+        root, depth = stack.pop()
+        if root is None or root.is_leaf() or depth == max_depth:
+            continue
+        li.append(astree(root))
+        stack.append((root.right, depth+1))
+        stack.append((root.left, depth+1))
 
 
 def _max_depth(n):
-    "Recursion of finding max depth of the tree"
-    if n is None:
-        return 0
-    left = _max_depth(n.left)
-    right = _max_depth(n.right)
-    return max(left, right) + 1
+    "Find the max depth of the tree from the given root"
+    depth = 0
+    stack = [(n, 1)]
+    while len(stack) > 0:
+        n, level = stack.pop()
+        if n is not None:
+            if level > depth:
+                depth = level
+            stack.append((n.left, level+1))
+            stack.append((n.right, level+1))
+    return depth
 
 
-def _level_traversal_node(root, level, tlist):
-    "Recursion of doing level order traversal"
-    if root is None:
+def _clone(n):
+    "Clone the tree from the given root, return the new root node"
+    if n is None:
         return
+    root = n.copy()
+    stack = [root]
+    while len(stack) > 0:
+        c = stack.pop()
+        # The copies have the same structure, so the children are set without
+        # dropping the hashes
+        if c._left is not None:
+            c._left = c._left.copy()
+            c._left.parent = c
+            stack.append(c._left)
+        if c._right is not None:
+            c._right = c._right.copy()
+            c._right.parent = c
+            stack.append(c._right)
+    return root
 
-    if level >= len(tlist):
-        l = []
-        tlist.append(l)
-    tlist[level].append(root)
-    _level_traversal_node(root.left, level+1, tlist)
-    _level_traversal_node(root.right, level+1, tlist)
 
+def _extend_tree(a, n, md):
+    "Extend the tree with empty nodes to depth md in order to print on console"
+    stack = [(n, 1)]
+    while len(stack) > 0:
+        n, level = stack.pop()
+        if n is None or level == md:
+            continue
+        if n.left is None:
+            n.left = node(None, n)
+        if n.right is None:
+            n.right = node(None, n)
+        stack.append((n.left, level+1))
+        stack.append((n.right, level+1))
+
+
+def _hash_subtree(n):
+    "Compute the missing hashes of the subtree from the given node, children first"
+    stack = [n]
+    while len(stack) > 0:
+        n = stack[-1]
+        left, right = n._left, n._right
+        if left is not None and left._hash is None:
+            stack.append(left)
+        elif right is not None and right._hash is None:
+            stack.append(right)
+        else:
+            stack.pop()
+            n._hash = hash((n._sym, None if left is None else left._hash,
+                            None if right is None else right._hash))
 
-def _clone(n):
-    "Recursion that clone the AST, return the root node"
-    if n is None:
-        return  
-    node = n.copy()
-    node.left = _clone(n.left)
-    node.right = _clone(n.right)
-    return node
 
+def _equal(a, b):
+    "Compare the subtrees from the given nodes by their structure"
+    stack = [(a, b)]
+    while len(stack) > 0:
+        a, b = stack.pop()
+        if a is b:
+            continue
+        if a is None or b is None or hash(a) != hash(b) or a._sym != b._sym:
+            return False
+        stack.append((a._left, b._left))
+        stack.append((a._right, b._right))
+    return True
 
-def _extend_tree(a, n, md):
-    "Recursion that extends the AST in order to print on console"
-    if n is None:
-        return
-    if n.left is None and _at_level(n, a) != md:
-        n.left = node(None)
-    if n.right is None and _at_level(n, a) != md:
-        n.right = node(None)
-    _extend_tree(a, n.left, md)
-    _extend_tree(a, n.right, md)
 
+def _print_syms(li):
+    "Print the symbols of a traversal on one line"
+    print()
+    if len(li) > 0:
+        print(*li, end=" ")
 
-def _at_level(n, tree):
-    "Recursion that tells which level the node is at"
-    levels = []
-    _level_traversal_node(tree.root, 0, levels)
-    for index in range(len(levels)):
-        if n in levels[index]:
-            return index+1
-    return -1
+
+# Kinds of entries on the operator stack of `parse`, brackets come last
+_BINARY, _PREFIX, _FUNC, _GROUP, _CALL = range(5)
+
+
+def _apply(kind, sym, operands):
+    "Pop the operands of an operator or function and push the new node"
+    binary = kind == _BINARY or (kind == _FUNC and not is_unary(sym))
+    if len(operands) < (2 if binary else 1):
+        raise ParseException("Missing operand for: " + sym)
+    right = operands.pop()
+    left = operands.pop() if binary else None
+    n = node(sym, None, left, right)
+    if left is not None:
+        left.parent = n
+    if right is not None:
+        right.parent = n
+    operands.append(n)
+
+
+def _reduce_group(ops, operands):
+    "Apply every operator above the innermost bracket"
+    while len(ops) > 0 and ops[-1][0] < _GROUP:
+        _apply(*ops.pop()[:2], operands)
+
+
+# The parse cache of `build`, None if it is disabled
+_cache = None
+
+
+# The symbol tables that the cached trees were built with
+_cache_grammar = [None]
+
+
+# The result cache of `evaluate`, None if it is disabled
+_results = None
+
+
+# Marks a miss of the result cache, since any value can be a result
+_MISSING = object()
+
+
+class _result_key():
+    """
+    Key of the result cache for a tree and the values of its variables.
+    The key is hashed by the cached hash of the root, see `_hash_subtree`,
+    and compared by `_equal`, so that looking it up does not walk the tree
+    unless the structures have the same hash. The functions of the nodes
+    tell trees built with different mappers apart.
+    """
+    __slots__ = ("root", "fns", "values", "_hash")
+
+    def __init__(self, root, fns, values):
+        self.root = root
+        self.fns = fns
+        self.values = values
+        self._hash = hash((None if root is None else hash(root), values))
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self._hash != other._hash or self.values != other.values:
+            return False
+        if self.fns is not other.fns and self.fns != other.fns:
+            return False
+        if self.root is None or other.root is None:
+            return self.root is other.root
+        return _equal(self.root, other.root)
+
+
+def _tree_key(a, vars):
+    """
+    Return the key of the result cache for the tree and the values of its
+    variables, or None if a value is missing. The functions and variables
+    of the tree are kept in the tree until it is modified, which changes the
+    hash of the root, or its root is replaced.
+    """
+    h = None if a.root is None else hash(a.root)
+    if a._key is None or a._key[0] is not a.root or a._key[1] != h:
+        fns = []
+        variables = set()
+        stack = [a.root]
+        while len(stack) > 0:
+            n = stack.pop()
+            if n is None:
+                continue
+            fns.append(n.fn)
+            if n.kind == NODE_VAR:
+                variables.add(n.sym)
+            stack.append(n.right)
+            stack.append(n.left)
+        a._key = (a.root, h, tuple(fns), tuple(sorted(variables)))
+    root, _, fns, variables = a._key
+    for v in variables:
+        if v not in vars:
+            return None
+    values = tuple(float(vars[v]) for v in variables)
+    if 0.0 in values:
+        # 0.0 and -0.0 are equal but may give different results
+        values += tuple(math.copysign(1.0, v) for v in values)
+    return _result_key(root, fns, values)
+
+
+def _build(e, use_postfix, folded):
+    "Build the tree of a whitespace free expression"
+    if not use_postfix:
+        a = astree(parse(e))
+    else:
+        a = astree.from_postfix(postfix(e))
+    if folded:
+        fold(a)
+    return a
+
+
+def _grammar():
+    "Snapshot of the symbol tables, it changes if any of them is modified"
+    return (tuple(symbols.items()), tuple(function_mapper.items()),
+            tuple(unary_function_mapper.items()), tuple(binary_function_mapper.items()),
+            tuple(opeartors_mapper.items()), tuple(special_number.items()))
+
+
+def _count(n):
+    "Count the nodes of the tree from the given root"
+    count = 0
+    stack = [n]
+    while len(stack) > 0:
+        n = stack.pop()
+        if n is not None:
+            count += 1
+            stack.append(n.left)
+            stack.append(n.right)
+    return count
@@ -0,0 +1,114 @@
+"""
+This module contains `compile`, which turns an AST into a Python function
+so that the tree does not have to be walked on every evaluation.
+"""
+
+
+import builtins
+import keyword
+from .expr import *
+from .excepts import *
+
+
+def compile(a):
+    """
+    Compile the given AST into a Python function and return it. The function
+    takes the values of the variables in the tree as arguments, in the order
+    of `variables` attribute of the function (sorted by name), and returns
+    the same result as `evaluate`, using the same functions from the mappers.
+    Variables that are Python keywords are renamed with a trailing `_`
+    when passed as keyword arguments. The generated code is in `source`
+    attribute of the function.
+
+    Raise `EvaluationException` if the tree contains unknown symbols.
+
+    @param
+    ---
+    `a` The AST
+    """
+    order = _postorder(a.root)
+    variables = sorted({n.sym for n in order if n is not None and n.kind == NODE_VAR})
+    params = {v: _param(v) for v in variables}
+    funcs = {}
+    lines = []
+    stack = []
+    for n in order:
+        if n is None:
+            stack.append("0")
+        elif n.kind == NODE_CONST:
+            stack.append(_literal(n.value, funcs))
+        elif n.kind == NODE_VAR:
+            stack.append(params[n.sym])
+        elif n.kind == NODE_UNARY or n.kind == NODE_BINARY:
+            args = stack.pop()
+            if n.kind == NODE_BINARY:
+                args = stack.pop() + ", " + args
+            temp = "_%d" % len(stack)
+            lines.append("%s = %s(%s)" % (temp, _name(n.fn, funcs), args))
+            stack.append(temp)
+        else:
+            raise EvaluationException("Unknown symbol: " + str(n.sym))
+    casts = ["%s = _float(%s)" % (p, p) for p in params.values()]
+    body = casts + lines + ["return " + (stack[0] if len(stack) > 0 else "0")]
+    source = "def _make(_float%s):\n" % "".join(", " + f for f in funcs.values()) + \
+             "    def expression(%s):\n" % ", ".join(params.values()) + \
+             "".join("        " + line + "\n" for line in body) + \
+             "    return expression\n"
+    namespace = {}
+    exec(builtins.compile(source, "<expression>", "exec"), namespace)
+    f = namespace["_make"](float, *(key.value for key in funcs))
+    f.variables = tuple(variables)
+    f.source = source
+    return f
+
+
+def _postorder(root):
+    "Return the nodes in post-order as evaluated, None for missing operands"
+    order = []
+    stack = [root]
+    while len(stack) > 0:
+        n = stack.pop()
+        order.append(n)
+        if n is None or n.kind == NODE_CONST or n.kind == NODE_VAR:
+            continue
+        if n.kind != NODE_UNARY:
+            stack.append(n._left)
+        stack.append(n._right)
+    order.reverse()
+    return order
+
+
+class _value():
+    "Hashable wrapper of a function or a constant, compared by identity"
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return id(self.value)
+
+    def __eq__(self, other):
+        return self.value is other.value
+
+
+def _name(f, funcs):
+    "Return the name of the function in the generated code"
+    key = _value(f)
+    if key not in funcs:
+        funcs[key] = "_f%d" % len(funcs)
+    return funcs[key]
+
+
+def _literal(value, funcs):
+    "Return the code of a constant, constants without a literal are bound by name"
+    if isinstance(value, float) and value == value and value not in (float("inf"), float("-inf")):
+        return repr(value)
+    return _name(value, funcs)
+
+
+def _param(v):
+    "Return the parameter name of a variable"
+    if keyword.iskeyword(v):
+        return v + "_"
+    return v
@@ -0,0 +1,127 @@
+"""
+This module contains `dag`, an AST with its identical subtrees merged, so
+that each distinct subexpression is evaluated once.
+"""
+
+
+from .expr import *
+from .excepts import *
+
+
+class dag():
+    """
+    Directed Acyclic Graph of an AST. Identical subtrees, the ones with
+    the same symbols at the same places, are hash-consed into one node
+    that is shared by all of their parents. Node `i` is described by the
+    `i`-th item of each list:
+
+    `syms`, `kinds`, `fns`, `values` The symbol of the node and its
+    classification, see `classify`
+
+    `left`, `right` Indices of the children, -1 if there is none
+
+    `refs` Number of parents that share the node
+
+    Children always come before their parents and the root is the last
+    node, so that evaluation is a single loop that computes each node once.
+    """
+    def __init__(self):
+        self.syms = []
+        self.kinds = []
+        self.fns = []
+        self.values = []
+        self.left = []
+        self.right = []
+        self.refs = []
+        self.tree_nodes = 0
+
+    def __len__(self):
+        return len(self.syms)
+
+    @classmethod
+    def from_astree(cls, a):
+        """
+        Merge the identical subtrees of the given AST into a `dag`.
+
+        @param
+        ---
+        `a` The AST
+        """
+        d = cls()
+        order = []
+        stack = [a.root]
+        while len(stack) > 0:
+            n = stack.pop()
+            if n is not None:
+                order.append(n)
+                stack.append(n.left)
+                stack.append(n.right)
+        order.reverse()
+        d.tree_nodes = len(order)
+        # Index of the node in the graph for each node of the tree, and for each structure
+        index = {}
+        nodes = {}
+        for n in order:
+            left = -1 if n.left is None else index[id(n.left)]
+            right = -1 if n.right is None else index[id(n.right)]
+            key = (n.sym, left, right)
+            i = nodes.get(key)
+            if i is None:
+                i = nodes[key] = len(d.syms)
+                d.syms.append(n.sym)
+                d.kinds.append(n.kind)
+                d.fns.append(n.fn)
+                d.values.append(n.value)
+                d.left.append(left)
+                d.right.append(right)
+                d.refs.append(0)
+                if left >= 0:
+                    d.refs[left] += 1
+                if right >= 0:
+                    d.refs[right] += 1
+            index[id(n)] = i
+        return d
+
+    def evaluate(self, vars={}):
+        """
+        Evaluate the result of this graph, the same as `evaluate` does
+        for `astree`, but the shared nodes are computed once per call.
+        Raise `EvaluationException` if a value of the variables is missing.
+
+        @param
+        ---
+        `vars={}` The variables dict, for example: `{"x": 10, "y": 12}`
+        """
+        if len(self.syms) == 0:
+            return 0
+        kinds, fns, left, right = self.kinds, self.fns, self.left, self.right
+        # The extra last item stays 0, it is read through index -1 for missing children
+        values = [0] * (len(kinds) + 1)
+        for i in range(len(kinds)):
+            kind = kinds[i]
+            if kind == NODE_BINARY:
+                values[i] = fns[i](values[left[i]], values[right[i]])
+            elif kind == NODE_UNARY:
+                values[i] = fns[i](values[right[i]])
+            elif kind == NODE_CONST:
+                values[i] = self.values[i]
+            elif kind == NODE_VAR:
+                if self.syms[i] not in vars:
+                    raise EvaluationException("Undefined variable: " + self.syms[i])
+                values[i] = float(vars[self.syms[i]])
+            else:
+                values[i] = symbols[self.syms[i]](values[left[i]], values[right[i]])
+        return values[-2]
+
+    def info(self):
+        """
+        Return a dict with the statistics of sharing: the number of nodes
+        of the tree and of this graph, the nodes removed by merging, and
+        the nodes that are shared by more than one parent.
+        """
+        return {
+            "tree_nodes": self.tree_nodes,
+            "dag_nodes": len(self.syms),
+            "removed": self.tree_nodes - len(self.syms),
+            "shared": sum(1 for r in self.refs if r > 1)
+        }
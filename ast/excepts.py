@@ -3,4 +3,12 @@ class EvaluationException(Exception):
     Exception associated with evaluation of AST
     """
     def __init__(self, msg):
-        super().__init__(msg)
\ No newline at end of file
+        super().__init__(msg)
+
+
+class ParseException(Exception):
+    """
+    Exception associated with parsing of expression
+    """
+    def __init__(self, msg):
+        super().__init__(msg)
@@ -7,6 +7,7 @@ import random
 import collections
 import re
 import math
+import sys
 
 
 _Op = collections.namedtuple('Op', [
@@ -90,19 +91,65 @@ special_number = {
 }
 
 
+# Kinds of nodes, stored in `node.kind`, see `classify`
+NODE_CONST, NODE_VAR, NODE_UNARY, NODE_BINARY, NODE_OTHER = range(5)
+
+
+# Kinds of tokens, stored in `token.kind`
+TOKEN_NUM, TOKEN_FUNC, TOKEN_DUMMY, TOKEN_OPER, TOKEN_LEFTB, TOKEN_RIGHTB = range(6)
+
+
 class token():
-    "A single token in the math expression"
+    """
+    A single token in the math expression. The kind of the token is
+    one of the `TOKEN_*` constants, the boolean flags of the constructor
+    and the `is_*` properties are kept for compatibility.
+    """
+    __slots__ = ("sym", "kind")
+
     def __init__(self, sym, is_num=False, is_func=False,
                     is_dummy=False, is_oper=False,
-                    is_leftb=False, is_rightb=False):
+                    is_leftb=False, is_rightb=False, kind=None):
         self.sym = sym
-        self.is_num = is_num
-        self.is_func = is_func
-        self.is_dummy = is_dummy
-        self.is_oper = is_oper
-        self.is_leftb = is_leftb
-        self.is_rightb = is_rightb
-    
+        if kind is None:
+            if is_num:
+                kind = TOKEN_NUM
+            elif is_func:
+                kind = TOKEN_FUNC
+            elif is_dummy:
+                kind = TOKEN_DUMMY
+            elif is_oper:
+                kind = TOKEN_OPER
+            elif is_leftb:
+                kind = TOKEN_LEFTB
+            elif is_rightb:
+                kind = TOKEN_RIGHTB
+        self.kind = kind
+
+    @property
+    def is_num(self):
+        return self.kind == TOKEN_NUM
+
+    @property
+    def is_func(self):
+        return self.kind == TOKEN_FUNC
+
+    @property
+    def is_dummy(self):
+        return self.kind == TOKEN_DUMMY
+
+    @property
+    def is_oper(self):
+        return self.kind == TOKEN_OPER
+
+    @property
+    def is_leftb(self):
+        return self.kind == TOKEN_LEFTB
+
+    @property
+    def is_rightb(self):
+        return self.kind == TOKEN_RIGHTB
+
     def __str__(self):
         return "token(sym=" + str(self.sym) +\
                     ", is_func=" + str(self.is_func) +\
@@ -136,7 +183,7 @@ def has_precedence(a, b):
              _OPS[a].precedence >= _OPS[b].precedence))
 
 
-def postfix(e):
+def postfix(e, tokens=False):
     """
     Convert infix expression to postfix expression and do
     tokenization to the expression. Return a list of
@@ -145,33 +192,35 @@ def postfix(e):
     @param
     ---
     `e` The expression in string format
+
+    `tokens=False` Return the `token` objects instead of their symbols,
+    so that the kinds do not have to be classified again
     """
-    tokens = tokenize(e)
     q = []
     op = []
-    index = 0
-    while index < len(tokens):
-        token = tokens[index]
-        if token.is_num or token.is_dummy:
+    for token in tokenize(e):
+        kind = token.kind
+        if kind == TOKEN_NUM or kind == TOKEN_DUMMY:
             q.append(token)
-        if token.is_leftb:
+        elif kind == TOKEN_LEFTB or kind == TOKEN_FUNC:
             op.append(token)
-        elif token.is_oper:
-            if len(op) > 0:
-                while len(op) > 0 and (op[-1].is_func or (op[-1].sym != "(" and has_precedence(op[-1].sym, token.sym))):
+        elif kind == TOKEN_OPER:
+            # A negation is a prefix operator, it has no left operand to pop operators for
+            if token.sym != "~":
+                while len(op) > 0 and (op[-1].kind == TOKEN_FUNC or (op[-1].kind != TOKEN_LEFTB and has_precedence(op[-1].sym, token.sym))):
                     q.append(op.pop())
-                op.append(token)
-            else:
-                op.append(token)
-        elif token.is_rightb:
-            while len(op) > 0 and op[-1].sym != "(":
+            op.append(token)
+        elif kind == TOKEN_RIGHTB:
+            while len(op) > 0 and op[-1].kind != TOKEN_LEFTB:
                 q.append(op.pop())
             op.pop()
-        elif token.is_func:
-            op.append(token)
-        index += 1
+            # The bracket of a call closes the function as well
+            if len(op) > 0 and op[-1].kind == TOKEN_FUNC:
+                q.append(op.pop())
     while len(op) > 0:
         q.append(op.pop())
+    if tokens:
+        return q
     return [x.sym for x in q]
 
 
@@ -218,7 +267,7 @@ def is_evaluable(s):
     """
     tokens = tokenize(s)
     for token in tokens:
-        if token.is_dummy and token.sym not in special_number:
+        if token.kind == TOKEN_DUMMY and token.sym not in special_number:
             return False
     return True
 
@@ -300,6 +349,39 @@ def is_special_number(s):
     return s in special_number
 
 
+def classify(s):
+    """
+    Classify a symbol the same way as `evaluate` does, and return a tuple
+    of its kind, which is one of the `NODE_*` constants, its function
+    and its value:
+
+    `NODE_UNARY`, `NODE_BINARY` The function is resolved from the mappers
+
+    `NODE_CONST` Numbers and special numbers, the value is the float
+
+    `NODE_VAR` Variables, see `is_var`
+
+    `NODE_OTHER` Anything else, such as `None`
+
+    @param
+    ---
+    `s` A symbol in string
+    """
+    if not isinstance(s, str):
+        return NODE_OTHER, None, None
+    if is_unary(s):
+        return NODE_UNARY, function_mapper[s], None
+    if s in symbols:
+        return NODE_BINARY, symbols[s], None
+    if is_number(s):
+        return NODE_CONST, None, float(s)
+    if is_special_number(s):
+        return NODE_CONST, None, special_number[s]
+    if is_var(s):
+        return NODE_VAR, None, None
+    return NODE_OTHER, None, None
+
+
 def rand_exp(n, low, high, basic_only=True, int_only=True):
     """
     Generate a random math expression with random operators.
@@ -330,76 +412,116 @@ def tokenize(e):
     will be ignored. And also, tokenizer will not recongize
     any wrong patterns or errors in the expression.
 
+    The expression is scanned in a single pass by one precompiled
+    regex, see `tokenize_spans`.
+
     @param
     ---
     `e` The expression in string format
     """
-    index = 0
-    eindex = 0
+    return [token(span_text(e, span), kind=span[0]) for span in tokenize_spans(e)]
+
+
+def tokenize_spans(e):
+    """
+    Tokenize the expression the same way as `tokenize`, but return a
+    list of `(kind, start, end)` tuples that point into `e` instead of
+    `token` objects, so no symbol text is copied. Use `span_text` and
+    `span_value` to read a span when it is needed.
+
+    A negation that is rewritten from a minus sign has no text in the
+    expression, it is returned as the empty span `(TOKEN_OPER, i, i)`
+    where `i` is the index of the minus sign.
+
+    @param
+    ---
+    `e` The expression, a str or a bytes-like object such as
+    `bytes` or `memoryview`
+    """
+    scanner, func_regex, operand_end, signed_regex = _scanner(isinstance(e, str))
+    match = scanner.match
     result = []
-    starts, ends = _match_regex(_func_regex(), e)
-    while index < len(e):
-        if index in starts:
-            result.append(token(e[index: ends[eindex]], is_func=True))
-            index = ends[eindex]
-            eindex += 1
-            continue
-        t = e[index]
-        if is_digit(t):
-            t, index = _sub_num(index, e)
-            result.append(t)
-        elif is_letter(t):
-            t, index = _sub_dummy(index, e)
-            result.append(t)
-        elif t == "(":
-            result.append(token(t, is_leftb=True))
-        elif t == ")":
-            result.append(token(t, is_rightb=True))
-        elif is_operator(t):
-            if t == "-":
-                if index > 0:
-                    prev, next_t = e[index-1], e[index+1]
-                    if is_digit(prev) or is_letter(prev) or prev == ")":
-                        result.append(token(t, is_oper=True))
-                    elif index + 1 in starts:
-                        result.append(token("~", is_oper=True))
-                    elif is_digit(next_t):
-                        index += 1
-                        t, index = _sub_num(index, e, "-")
-                        result.append(t)
-                    elif is_letter(next_t):
-                        index += 1
-                        t, index = _sub_dummy(index, e, "-")
-                        result.append(t)
-                    else:
-                        result.append(token("~", is_oper=True))
-                else:
-                    next_t = e[index+1]
-                    if is_digit(next_t):
-                        index += 1
-                        t, index = _sub_num(index, e, "-")
-                        result.append(t)
-                    elif index + 1 in starts:
-                        result.append(token("~", is_oper=True))
-                    elif is_letter(next_t):
-                        index += 1
-                        t, index = _sub_dummy(index, e, "-")
-                        result.append(t)
-                    else:
-                        result.append(token("~", is_oper=True))
-            elif t == "^":
-                if len(result) >= 1:
-                    prev = result[-1]
-                    if (prev.is_num or prev.is_dummy) and prev.sym[0] == "-":
-                        result[-1] = token("~", is_oper=True)
-                        result.append(token(prev.sym[1:], is_num=prev.is_num, is_dummy=prev.is_dummy))
-                result.append(token(t, is_oper=True))
+    signed = -1
+    index = 0
+    length = len(e)
+    while index < length:
+        m = match(e, index)
+        group = m.lastindex
+        end = m.end()
+        if group == 1:
+            result.append((TOKEN_FUNC, index, end))
+        elif group == 2:
+            result.append((TOKEN_NUM, index, end))
+        elif group == 3:
+            result.append((TOKEN_DUMMY, index, end))
+        elif group == 4:
+            if index > 0 and operand_end.match(e, index-1):
+                result.append((TOKEN_OPER, index, end))
+            elif func_regex.match(e, end):
+                result.append((TOKEN_OPER, index, index))
             else:
-                result.append(token(t, is_oper=True))
-        index += 1
+                m = signed_regex.match(e, end)
+                if m is None:
+                    result.append((TOKEN_OPER, index, index))
+                else:
+                    end = m.end()
+                    signed = len(result)
+                    result.append((TOKEN_NUM if m.lastindex == 1 else TOKEN_DUMMY, index, end))
+        elif group == 5:
+            if signed >= 0 and signed == len(result) - 1:
+                kind, start, stop = result[-1]
+                result[-1] = (TOKEN_OPER, start, start)
+                result.append((kind, start+1, stop))
+            result.append((TOKEN_OPER, index, end))
+        elif group == 6:
+            result.append((TOKEN_OPER, index, end))
+        elif group == 7:
+            result.append((TOKEN_LEFTB, index, end))
+        elif group == 8:
+            result.append((TOKEN_RIGHTB, index, end))
+        index = end
     return result
 
 
+def span_text(e, span):
+    """
+    Return the symbol of a span from `tokenize_spans` as str. Names of
+    functions and variables are interned.
+
+    @param
+    ---
+    `e` The expression that the span points into
+
+    `span` A `(kind, start, end)` tuple
+    """
+    kind, start, end = span
+    if start == end:
+        return "~"
+    text = e[start:end]
+    if not isinstance(text, str):
+        text = bytes(text).decode()
+    if kind == TOKEN_FUNC or kind == TOKEN_DUMMY:
+        return sys.intern(text)
+    return text
+
+
+def span_value(e, span):
+    """
+    Return the value of a number span from `tokenize_spans` as float,
+    without building its str first.
+
+    @param
+    ---
+    `e` The expression that the span points into
+
+    `span` A `(kind, start, end)` tuple of kind `TOKEN_NUM`
+    """
+    text = e[span[1]:span[2]]
+    if isinstance(text, memoryview):
+        text = bytes(text)
+    return float(text)
+
+
 def _gen_rand_exp_oper(n, m, low, high, int_only):
     "Generate expression with basic operators only"
     rand = random.choice(list(opeartors_mapper.keys()))
@@ -454,56 +576,34 @@ def _gen_rand_exp(n, m, low, high, int_only):
                 return "("+_gen_rand_exp(n+1, m, low, high, int_only)+ rand + rand_b+")"
 
 
-def _sub_dummy(index, e, prev=""):
-    d = prev
-    while index < len(e) and is_letter(e[index]):
-        d += e[index]
-        index += 1
-    index -= 1
-    return token(d, is_dummy=True), index
-
-
-def _sub_num(index, e, prev=""):
-    d = prev
-    while index < len(e) and (is_digit(e[index]) or e[index] == "."):
-        d += e[index]
-        index += 1
-    index -= 1
-    return token(d, is_num=True), index
-
-
-def _sub_func(index, e, prev):
-    d = prev
-    while index < len(e) and is_digit(e[index]):
-        d += e[index]
-        index += 1
-    index -= 1
-    return token(d, is_func=True), index
-
-
-def _func_regex():
-    "Construct regex for special math functions"
-    regex = "("
-    for f in function_mapper:
-        if "(" in f:
-            index = f.find("(")
-            regex += f[:index] + "\\" + f[index:] + "|"
-        else:
-            regex += f + "|"
-    for f in unary_function_mapper:
-        if "(" in f:
-            index = f.find("(")
-            regex += f[:index] + "\\" + f[index:] + "|"
-        else:
-            regex += f + "|"
-    return regex[:-1] + ")"
-
-
-def _match_regex(r, e):
-    "Match the functions regex and return a list of start indices and a list of end indices"
-    reg = re.compile(r)
-    starts, ends = [], []
-    for m in reg.finditer(e):
-        starts.append(m.start())
-        ends.append(m.end())
-    return starts, ends
+def _scanner(text=True):
+    """
+    Return the regexes that `tokenize_spans` scans with: the master regex
+    that matches one token per call, the regex of function names, the
+    characters that end an operand and the number or letters that absorb
+    a minus sign. They are compiled once and rebuilt only when the function
+    names in `function_mapper` change. Set `text` to False to get the
+    patterns for bytes-like expressions.
+
+    Groups of the master regex: 1 function, 2 number, 3 letters,
+    4 minus sign, 5 power, 6 other operators, 7 left bracket,
+    8 right bracket. Anything else (',', spaces) matches without a group
+    and is skipped.
+    """
+    global _scanner_cache
+    names = tuple(function_mapper) + tuple(unary_function_mapper)
+    if _scanner_cache is None or _scanner_cache[0] != names:
+        funcs = "|".join(re.escape(f) for f in dict.fromkeys(names) if f) or "(?!)"
+        patterns = [
+            "(" + funcs + ")|([0-9.]+)|([^\\W\\d_]+)|(-)|(\\^)|([+*/])|(\\()|(\\))|.",
+            funcs,
+            "[0-9.)]|[^\\W\\d_]",
+            "([0-9.]+)|([^\\W\\d_]+)"
+        ]
+        _scanner_cache = (names,
+            tuple(re.compile(p, re.DOTALL) for p in patterns),
+            tuple(re.compile(p.encode(), re.DOTALL) for p in patterns))
+    return _scanner_cache[1] if text else _scanner_cache[2]
+
+
+_scanner_cache = None
@@ -0,0 +1,255 @@
+"""
+This module contains `flattree`, an `astree` stored in typed arrays, one
+array per field of the nodes, instead of one object per node.
+"""
+
+
+import struct
+import sys
+from array import array
+from .ast import astree, node
+from .expr import *
+from .excepts import *
+
+
+# Header of serialized trees: magic, version, number of nodes and size of the names
+_HEADER = struct.Struct("<4sBII")
+_MAGIC = b"PEXF"
+_VERSION = 1
+
+
+class flattree():
+    """
+    Flat representation of an AST. Node `i` of the tree is described by
+    the `i`-th item of each array:
+
+    `op` Kind of the node, one of the `NODE_*` constants
+
+    `sym` Index of the symbol of the node in `names`
+
+    `payload` Value of a constant, or slot of a variable in `variables`
+
+    `left`, `right`, `parent` Indices of the children and the parent,
+    -1 if there is none
+
+    Nodes are stored in post-order, children always come before their
+    parent and the root is the last node. Therefore, evaluation is a single
+    loop over the arrays and needs neither recursion nor a stack.
+    """
+    def __init__(self):
+        self.op = array("b")
+        self.sym = array("i")
+        self.payload = array("d")
+        self.left = array("i")
+        self.right = array("i")
+        self.parent = array("i")
+        self.names = []
+        self.variables = []
+
+    def __len__(self):
+        return len(self.op)
+
+    @classmethod
+    def from_astree(cls, a):
+        """
+        Convert the given AST to a `flattree`.
+
+        @param
+        ---
+        `a` The AST
+        """
+        t = cls()
+        order = []
+        stack = [a.root]
+        while len(stack) > 0:
+            n = stack.pop()
+            if n is not None:
+                order.append(n)
+                stack.append(n.left)
+                stack.append(n.right)
+        order.reverse()
+        index = {}
+        names = {}
+        slots = {}
+        for i, n in enumerate(order):
+            index[id(n)] = i
+            if n.sym not in names:
+                names[n.sym] = len(t.names)
+                t.names.append(n.sym)
+            kind, payload = n.kind, n.value or 0
+            if kind == NODE_VAR:
+                if n.sym not in slots:
+                    slots[n.sym] = len(t.variables)
+                    t.variables.append(n.sym)
+                payload = slots[n.sym]
+            t.op.append(kind)
+            t.sym.append(names[n.sym])
+            t.payload.append(payload)
+            t.left.append(-1 if n.left is None else index[id(n.left)])
+            t.right.append(-1 if n.right is None else index[id(n.right)])
+            t.parent.append(-1)
+        for i in range(len(order)):
+            if t.left[i] >= 0:
+                t.parent[t.left[i]] = i
+            if t.right[i] >= 0:
+                t.parent[t.right[i]] = i
+        return t
+
+    def to_astree(self):
+        """
+        Convert this tree back to an `astree` and return it.
+        """
+        # Each name is classified once, instead of once per node
+        classes = [classify(name) for name in self.names]
+        nodes = []
+        for s in self.sym:
+            n = node.__new__(node)
+            n._sym = self.names[s]
+            n.kind, n.fn, n.value = classes[s]
+            n.parent = n._left = n._right = n._hash = None
+            nodes.append(n)
+        for i, n in enumerate(nodes):
+            if self.left[i] >= 0:
+                n.left = nodes[self.left[i]]
+                n.left.parent = n
+            if self.right[i] >= 0:
+                n.right = nodes[self.right[i]]
+                n.right.parent = n
+        return astree(nodes[-1] if len(nodes) > 0 else None)
+
+    def dumps(self):
+        """
+        Serialize this tree to bytes, see `loads`.
+        """
+        names = "\0".join(self.names + [""] + self.variables).encode()
+        sections = [array("b", self.op), array("i", self.sym), array("d", self.payload),
+                    array("i", self.left), array("i", self.right), array("i", self.parent)]
+        if sys.byteorder == "big":
+            for s in sections:
+                s.byteswap()
+        header = _HEADER.pack(_MAGIC, _VERSION, len(self.op), len(names))
+        return header + b"".join(s.tobytes() for s in sections) + names
+
+    @classmethod
+    def loads(cls, data):
+        """
+        Load a tree serialized by `dumps`.
+
+        @param
+        ---
+        `data` The bytes
+        """
+        magic, version, count, nnames = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a serialized tree")
+        t = cls()
+        offset = _HEADER.size
+        for field, typecode in (("op", "b"), ("sym", "i"), ("payload", "d"),
+                                ("left", "i"), ("right", "i"), ("parent", "i")):
+            s = getattr(t, field)
+            size = s.itemsize * count
+            s.frombytes(data[offset:offset+size])
+            if sys.byteorder == "big":
+                s.byteswap()
+            offset += size
+        names = bytes(data[offset:offset+nnames]).decode().split("\0")
+        split = names.index("")
+        t.names = names[:split]
+        t.variables = names[split+1:]
+        return t
+
+    def evaluate(self, vars={}):
+        """
+        Evaluate the result of this tree, the same as `evaluate` does
+        for `astree`. Raise `EvaluationException` if a value of the
+        variables is missing.
+
+        @param
+        ---
+        `vars={}` The variables dict, for example: `{"x": 10, "y": 12}`
+        """
+        if len(self.op) == 0:
+            return 0
+        slots = []
+        for v in self.variables:
+            if v not in vars:
+                raise EvaluationException("Undefined variable: " + v)
+            slots.append(float(vars[v]))
+        funcs = [symbols.get(name) for name in self.names]
+        op, sym, payload, left, right = self.op, self.sym, self.payload, self.left, self.right
+        # The extra last item stays 0, it is read through index -1 for missing children
+        values = [0] * (len(op) + 1)
+        for i in range(len(op)):
+            kind = op[i]
+            if kind == NODE_BINARY:
+                values[i] = funcs[sym[i]](values[left[i]], values[right[i]])
+            elif kind == NODE_UNARY:
+                values[i] = funcs[sym[i]](values[right[i]])
+            elif kind == NODE_CONST:
+                values[i] = payload[i]
+            elif kind == NODE_VAR:
+                values[i] = slots[int(payload[i])]
+            else:
+                values[i] = symbols[self.names[sym[i]]](values[left[i]], values[right[i]])
+        return values[-2]
+
+    def max_depth(self):
+        """
+        Get the max depth of this tree.
+        """
+        parent = self.parent
+        depth = [0] * (len(parent) + 1)
+        for i in range(len(parent)-1, -1, -1):
+            depth[i] = depth[parent[i]] + 1
+        return max(depth)
+
+    def level_order(self):
+        """
+        Travel this tree level by level and return a list that contains
+        list of symbols at each level, start from root to the most bottom.
+        """
+        levels = []
+        current = [len(self.op) - 1] if len(self.op) > 0 else []
+        while len(current) > 0:
+            levels.append([self.names[self.sym[i]] for i in current])
+            current = [c for i in current for c in (self.left[i], self.right[i]) if c >= 0]
+        return levels
+
+    def preorder(self):
+        """
+        Travel this tree by `pre-order` way, and return a list that contains
+        the symbols.
+        """
+        li = []
+        stack = [len(self.op) - 1]
+        while len(stack) > 0:
+            i = stack.pop()
+            if i >= 0:
+                li.append(self.names[self.sym[i]])
+                stack.append(self.right[i])
+                stack.append(self.left[i])
+        return li
+
+    def inorder(self):
+        """
+        Travel this tree by `in-order` way, and return a list that contains
+        the symbols.
+        """
+        li = []
+        stack = []
+        i = len(self.op) - 1
+        while i >= 0 or len(stack) > 0:
+            while i >= 0:
+                stack.append(i)
+                i = self.left[i]
+            i = stack.pop()
+            li.append(self.names[self.sym[i]])
+            i = self.right[i]
+        return li
+
+    def postorder(self):
+        """
+        Travel this tree by `post-order` way, and return a list that contains
+        the symbols.
+        """
+        return [self.names[s] for s in self.sym]
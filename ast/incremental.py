@@ -0,0 +1,139 @@
+"""
+This module contains `incremental`, an evaluator that keeps the value of
+every subtree of an AST and recomputes only what a change of the variables
+affects.
+"""
+
+
+from .expr import *
+from .excepts import *
+
+
+class incremental():
+    """
+    Stateful evaluator of an AST. The value of every node is cached, and
+    `update` recomputes only the nodes on the paths from the leaves of the
+    changed variables to the root. The nodes recomputed and skipped by the
+    updates are counted, see `info`.
+
+    The structure of the tree is read when the evaluator is created, so
+    please create a new one if the tree is modified.
+    """
+    def __init__(self, a, vars={}):
+        """
+        Evaluate the given AST with the variables dict, the same as
+        `evaluate`, and keep the values. Raise `EvaluationException` if a
+        value of the variables is missing.
+
+        @param
+        ---
+        `a` The AST
+
+        `vars={}` The variables dict, for example: `{"x": 10, "y": 12}`
+        """
+        order = []
+        stack = [a.root]
+        while len(stack) > 0:
+            n = stack.pop()
+            if n is not None:
+                order.append(n)
+                stack.append(n.left)
+                stack.append(n.right)
+        order.reverse()
+        index = {id(n): i for i, n in enumerate(order)}
+        self._nodes = order
+        self._left = [-1 if n.left is None else index[id(n.left)] for n in order]
+        self._right = [-1 if n.right is None else index[id(n.right)] for n in order]
+        self._parent = [-1] * len(order)
+        for i in range(len(order)):
+            for c in (self._left[i], self._right[i]):
+                if c >= 0:
+                    self._parent[c] = i
+        # Leaves of each variable
+        self._leaves = {}
+        for i, n in enumerate(order):
+            if n.kind == NODE_VAR:
+                self._leaves.setdefault(n.sym, []).append(i)
+        self.vars = {}
+        for v in self._leaves:
+            if v not in vars:
+                raise EvaluationException("Undefined variable: " + v)
+            self.vars[v] = float(vars[v])
+        # The extra last item stays 0, it is read through index -1 for missing children
+        self._values = [0] * (len(order) + 1)
+        for i in range(len(order)):
+            self._compute(i)
+        self.recomputed = len(order)
+        self.skipped = 0
+
+    @property
+    def value(self):
+        "The value of the tree"
+        return self._values[-2] if len(self._nodes) > 0 else 0
+
+    def update(self, vars={}, **values):
+        """
+        Change the values of some variables and return the new value of the
+        tree. Only the nodes that depend on the changed variables are
+        recomputed, variables that are not in the tree are ignored. If the
+        computation raises an error, the previous values are kept.
+
+        @param
+        ---
+        `vars={}` The variables dict, for example: `{"x": 10}`
+
+        `**values` The variables as keyword arguments, for example: `x=10`
+        """
+        changed = {}
+        for v, value in list(vars.items()) + list(values.items()):
+            value = float(value)
+            if v in self._leaves and value != self.vars[v]:
+                changed[v] = value
+        dirty = set()
+        for v in changed:
+            for i in self._leaves[v]:
+                # Stop at nodes that are already marked, their ancestors are too
+                while i >= 0 and i not in dirty:
+                    dirty.add(i)
+                    i = self._parent[i]
+        dirty = sorted(dirty)
+        old = (dict(self.vars), [self._values[i] for i in dirty])
+        self.vars.update(changed)
+        try:
+            for i in dirty:
+                self._compute(i)
+        except Exception:
+            self.vars = old[0]
+            for i, value in zip(dirty, old[1]):
+                self._values[i] = value
+            raise
+        self.recomputed += len(dirty)
+        self.skipped += len(self._nodes) - len(dirty)
+        return self.value
+
+    def info(self):
+        """
+        Return a dict with the number of nodes, and the nodes recomputed and
+        skipped so far, the first evaluation counts as recomputed.
+        """
+        return {
+            "nodes": len(self._nodes),
+            "recomputed": self.recomputed,
+            "skipped": self.skipped
+        }
+
+    def _compute(self, i):
+        "Compute the value of the node `i` from its children"
+        n = self._nodes[i]
+        values = self._values
+        kind = n.kind
+        if kind == NODE_BINARY:
+            values[i] = n.fn(values[self._left[i]], values[self._right[i]])
+        elif kind == NODE_UNARY:
+            values[i] = n.fn(values[self._right[i]])
+        elif kind == NODE_CONST:
+            values[i] = n.value
+        elif kind == NODE_VAR:
+            values[i] = self.vars[n.sym]
+        else:
+            values[i] = symbols[n.sym](values[self._left[i]], values[self._right[i]])
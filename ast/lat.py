@@ -47,22 +47,32 @@ def genlat(a):
     ---
     `a` The AST
     """
-    def _eval(n):
+    order = []
+    stack = [a.root]
+    while len(stack) > 0:
+        n = stack.pop()
+        order.append(n)
+        if n is not None and not _is_atom(n.sym):
+            stack.append(n.left)
+            stack.append(n.right)
+    values = []
+    for n in reversed(order):
         if n is None:
-            return ''
-        if n.sym in special_mapper:
-            return special_mapper[n.sym](n.sym)
-        if is_number(n.sym) or (is_letter(n.sym) and not is_func(n.sym)):
-            return n.sym
-        left = _eval(n.left)
-        right = _eval(n.right)
-        if n.sym in latex_mapper:
-            return latex_mapper[n.sym](left, right)
-        elif is_unary(n.sym):
-            return n.sym + '(' + _eval(n.right) + ')'
+            values.append('')
+        elif n.sym in special_mapper:
+            values.append(special_mapper[n.sym](n.sym))
+        elif _is_atom(n.sym):
+            values.append(n.sym)
         else:
-            return '{'+left + n.sym + right+'}'
-    return '$'+_eval(a.root)+'$'
+            right = values.pop()
+            left = values.pop()
+            if n.sym in latex_mapper:
+                values.append(latex_mapper[n.sym](left, right))
+            elif is_unary(n.sym):
+                values.append(n.sym + '(' + right + ')')
+            else:
+                values.append('{'+left + n.sym + right+'}')
+    return '$'+values[0]+'$'
 
 
 def gentex(lat, loc, name):
@@ -138,3 +148,8 @@ def quickgen(a, des, name, op=False):
     genpdf(os.path.join(des, name+'.tex'), des, rm=True)
     if op:
         open_file(os.path.join(des, name+'.pdf'))
+
+
+def _is_atom(sym):
+    "Return True if the symbol is written as it is, without children"
+    return sym in special_mapper or is_number(sym) or (is_letter(sym) and not is_func(sym))
@@ -0,0 +1,106 @@
+"""
+This module contains `lru`, a bounded cache that evicts the least
+recently used entries first.
+"""
+
+
+import collections
+import time
+
+
+class lru():
+    """
+    A bounded Least Recently Used cache. It keeps at most `max_entries`
+    entries, and if `max_size` is given, the total size of the entries
+    (given by `put`) is kept under it as well. If `ttl` is given, entries
+    expire `ttl` seconds after they are put. Hits, misses, evictions and
+    expirations are counted, see `info`.
+    """
+    def __init__(self, max_entries=1024, max_size=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """
+        Return the value of the key and mark it as the most recently
+        used one, or return default if the key is not cached.
+
+        @param
+        ---
+        `key` The key
+
+        `default=None` The value returned on a miss
+        """
+        entry = self._data.get(key)
+        if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+            self.size -= self._data.pop(key)[1]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size=1):
+        """
+        Cache the value under the key, and evict the least recently used
+        entries until the cache is under its limits again. A value that is
+        larger than `max_size` by itself is not cached.
+
+        @param
+        ---
+        `key` The key
+
+        `value` The value
+
+        `size=1` The size of the value that counts towards `max_size`
+        """
+        if self.max_size is not None and size > self.max_size:
+            return
+        if key in self._data:
+            self.size -= self._data.pop(key)[1]
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        self._data[key] = (value, size, expires)
+        self.size += size
+        while len(self._data) > self.max_entries or \
+                (self.max_size is not None and self.size > self.max_size):
+            _, (_, s, _) = self._data.popitem(last=False)
+            self.size -= s
+            self.evictions += 1
+
+    def clear(self):
+        "Remove all entries, the counters are kept"
+        self._data.clear()
+        self.size = 0
+
+    def info(self):
+        """
+        Return a dict with the counters and the current usage of the cache.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / (self.hits + self.misses) if self.hits + self.misses > 0 else 0.0,
+            "entries": len(self._data),
+            "size": self.size,
+            "max_entries": self.max_entries,
+            "max_size": self.max_size,
+            "ttl": self.ttl
+        }
@@ -0,0 +1,76 @@
+"""
+This module contains passes that rewrite an AST into a smaller tree with
+the same value.
+"""
+
+
+from .expr import *
+from .excepts import *
+
+
+def fold(a):
+    """
+    Fold every subtree of the given AST that has no variables into a single
+    number, in place, and return the number of nodes removed. Numbers and
+    special numbers are computed by the functions of the nodes, which are
+    the same as `evaluate` uses. Subtrees that raise errors or give complex
+    numbers are kept, so `evaluate` still raises the same errors.
+
+    @param
+    ---
+    `a` The AST
+    """
+    removed = 0
+    for n in _postorder(a.root):
+        if n.kind == NODE_BINARY:
+            children = (n.left, n.right)
+        elif n.kind == NODE_UNARY and n.left is None:
+            children = (n.right,)
+        else:
+            continue
+        if any(c is not None and c.kind != NODE_CONST for c in children):
+            continue
+        try:
+            value = n.fn(*(0 if c is None else c.value for c in children))
+        except (ValueError, TypeError, ZeroDivisionError, OverflowError):
+            continue
+        if not isinstance(value, (int, float)):
+            continue
+        removed += (n.left is not None) + (n.right is not None)
+        n.sym = repr(float(value))
+        n.left = n.right = None
+    return removed
+
+
+def specialize(a, vars):
+    """
+    Substitute the variables of the given AST that are bound in `vars` by
+    their values, fold the subtrees that become constant, see `fold`, and
+    return the new tree in the remaining variables with the number of nodes
+    removed. The given tree is not modified.
+
+    @param
+    ---
+    `a` The AST
+
+    `vars` The variables dict of the bound variables, for example: `{"y": 2, "z": 3}`
+    """
+    s = a.copy()
+    for n in _postorder(s.root):
+        if n.kind == NODE_VAR and n.sym in vars:
+            n.sym = repr(float(vars[n.sym]))
+    return s, fold(s)
+
+
+def _postorder(root):
+    "Return the nodes of the tree in post-order, children before their parent"
+    order = []
+    stack = [root]
+    while len(stack) > 0:
+        n = stack.pop()
+        if n is not None:
+            order.append(n)
+            stack.append(n.left)
+            stack.append(n.right)
+    order.reverse()
+    return order
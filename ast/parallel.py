@@ -0,0 +1,149 @@
+"""
+This module builds and evaluates ASTs in a pool of processes, so that pure
+Python parsing and evaluation are not bound to one core by the GIL.
+"""
+
+
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+from .expr import *
+from .excepts import *
+from .vm import program
+from .flat import flattree
+from .ast import build
+
+
+# State of a worker process, set once by the pool initializer
+_state = {}
+
+
+def build_many(expressions, processes=None, chunksize=64):
+    """
+    Build the ASTs of the expressions in a pool of processes, and return
+    the list of the trees in the same order. The trees are sent back from
+    the workers serialized as `flattree`, not as pickled nodes. An
+    expression that cannot be built does not stop the others, the
+    exception it raised is in its place of the list instead of a tree.
+
+    @param
+    ---
+    `expressions` Iterable of expressions, it is read lazily
+
+    `processes=None` Number of processes, the number of CPUs by default
+
+    `chunksize=64` Number of expressions sent to a worker at a time
+    """
+    trees = []
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap(_build_item, expressions, chunksize):
+            if isinstance(result, bytes):
+                result = flattree.loads(result).to_astree()
+            trees.append(result)
+    return trees
+
+
+def _build_item(e):
+    "Build the expression and return the serialized tree, or the exception"
+    try:
+        return flattree.from_astree(build(e)).dumps()
+    except Exception as ex:
+        return ex
+
+
+def evaluate_many(a, bindings, processes=None, errors=None):
+    """
+    Evaluate the given AST once for each variables dict of `bindings` in a
+    pool of processes, and return the list of the results in the same order.
+    The tree is sent to each worker once as a serialized `program`. The
+    values of the variables and the results are stored column by column in
+    shared memory, and each worker fills a slice of the results, so nothing
+    is pickled per row.
+
+    A row that misses a variable, has a value that is not a number, raises
+    an error or gives a complex number does not stop the others, its result
+    is `nan`. If `errors` is a list, the index and the
+    message of each of these rows are appended to it, otherwise
+    `EvaluationException` is raised for the first of them after all the
+    rows are evaluated.
+
+    @param
+    ---
+    `a` The AST, or its `program`
+
+    `bindings` Sequence of variables dicts, for example: `[{"x": 1, "y": 2}, {"x": 3, "y": 4}]`
+
+    `processes=None` Number of processes, the number of CPUs by default
+
+    `errors=None` List that gets the `(index, message)` tuples of the rows that can not be evaluated
+    """
+    p = a if isinstance(a, program) else program.from_astree(a)
+    rows = len(bindings)
+    if rows == 0:
+        return []
+    n = len(p.variables)
+    shm = shared_memory.SharedMemory(create=True, size=8 * rows * (n + 1))
+    columns = shm.buf.cast("d")
+    try:
+        # Rows whose values can not be read are not evaluated, they stay nan
+        failed = {}
+        for i, b in enumerate(bindings):
+            for k, v in enumerate(p.variables):
+                try:
+                    if v not in b:
+                        raise EvaluationException("Undefined variable: " + v)
+                    columns[k*rows + i] = float(b[v])
+                except Exception as e:
+                    failed[i] = "%s: %s" % (type(e).__name__, e)
+                    break
+        processes = min(processes or os.cpu_count() or 1, rows)
+        # A few slices per process, so that slow slices do not leave processes idle
+        count = min(rows, 4 * processes)
+        bounds = [rows * k // count for k in range(count + 1)]
+        with multiprocessing.Pool(processes, _init_evaluate, (p.dumps(), shm.name, rows, sorted(failed))) as pool:
+            for slice_errors in pool.map(_evaluate_slice, zip(bounds, bounds[1:])):
+                failed.update(slice_errors)
+        failed = sorted(failed.items())
+        if errors is not None:
+            errors.extend(failed)
+        elif len(failed) > 0:
+            raise EvaluationException("Row %d: %s" % failed[0])
+        return columns[n*rows:].tolist()
+    finally:
+        columns.release()
+        shm.close()
+        shm.unlink()
+
+
+def _init_evaluate(data, name, rows, skipped):
+    "Load the program and attach the shared memory in a worker process"
+    shm = shared_memory.SharedMemory(name=name)
+    _state["program"] = program.loads(data)
+    _state["shm"] = shm
+    _state["columns"] = shm.buf.cast("d")
+    _state["rows"] = rows
+    _state["skipped"] = set(skipped)
+
+
+def _evaluate_slice(bounds):
+    """
+    Evaluate the rows in the range `bounds` and store the results, and
+    return the indices and the messages of the rows that failed
+    """
+    p, columns, rows, skipped = _state["program"], _state["columns"], _state["rows"], _state["skipped"]
+    n = len(p.variables)
+    run = p.run
+    errors = []
+    for i in range(*bounds):
+        if i in skipped:
+            columns[n*rows + i] = float("nan")
+            continue
+        try:
+            value = run([columns[k*rows + i] for k in range(n)])
+            if isinstance(value, complex):
+                raise EvaluationException("Complex result: " + str(value))
+        except Exception as e:
+            errors.append((i, "%s: %s" % (type(e).__name__, e)))
+            value = float("nan")
+        columns[n*rows + i] = value
+    return errors
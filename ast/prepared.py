@@ -0,0 +1,68 @@
+"""
+This module contains `prepared`, an AST prepared for evaluation with its
+variables resolved to positional slots.
+"""
+
+
+from .expr import *
+from .excepts import *
+from .compiler import compile
+
+
+class prepared():
+    """
+    An AST prepared for many evaluations. The variables of the tree are
+    resolved once into ordered slots, `variables` are their names and
+    `slots` maps the names to their indices. Values are then given
+    positionally, as a tuple, list or `array`, so that evaluation does
+    not look up any names. The tree is compiled by `compile`, please
+    prepare it again if the tree is modified.
+    """
+    def __init__(self, a):
+        self._function = compile(a)
+        self.variables = self._function.variables
+        self.slots = {v: i for i, v in enumerate(self.variables)}
+
+    def __len__(self):
+        return len(self.variables)
+
+    def __call__(self, values=()):
+        """
+        Evaluate the tree with the values of the variables in the order of
+        `variables`, and return the result. Raise `EvaluationException` if
+        the number of values is wrong.
+
+        @param
+        ---
+        `values=()` Sequence of the values of the variables
+        """
+        if len(values) != len(self.variables):
+            raise EvaluationException("Expected %d values, got %d" % (len(self.variables), len(values)))
+        return self._function(*values)
+
+    def values(self, vars):
+        """
+        Return the tuple of the values of the variables from the variables
+        dict, in the order of `variables`. Raise `EvaluationException` that
+        names all of the missing variables before anything is evaluated.
+
+        @param
+        ---
+        `vars` The variables dict, for example: `{"x": 10, "y": 12}`
+        """
+        missing = [v for v in self.variables if v not in vars]
+        if len(missing) > 0:
+            raise EvaluationException("Undefined variables: " + ", ".join(missing))
+        return tuple(vars[v] for v in self.variables)
+
+    def evaluate(self, vars={}):
+        """
+        Evaluate the tree with the variables dict, the same as `evaluate`
+        does for `astree`, but the missing variables are found before
+        anything is evaluated, see `values`.
+
+        @param
+        ---
+        `vars={}` The variables dict, for example: `{"x": 10, "y": 12}`
+        """
+        return self._function(*self.values(vars))
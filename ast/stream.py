@@ -0,0 +1,121 @@
+"""
+This module evaluates an AST over rows of CSV files, one row at a time, so
+that files of any size are evaluated in constant memory.
+"""
+
+
+import csv
+import time
+from .expr import *
+from .excepts import *
+from .vm import program
+
+
+def evaluate_csv(a, source, target, column="result", delimiter=","):
+    """
+    Evaluate the given AST for each row of the CSV file `source`, and write
+    the rows with the result appended to the CSV file `target`. The first
+    row is the header, the variables of the tree are the columns with the
+    same names. Rows are read and written one at a time, empty rows are
+    skipped. Rows that can not be evaluated, for example a division by zero,
+    or give complex numbers are written with an empty result and the run
+    goes on. Return a dict with
+    the number of rows, the seconds taken, the rows per second, and the
+    errors as a list of the line numbers and the messages.
+
+    Raise `EvaluationException` if a variable has no column, or a row has
+    fewer columns than the variables need, with the line number of the row.
+
+    @param
+    ---
+    `a` The AST, or its `program`
+
+    `source` The CSV file object to read
+
+    `target` The CSV file object to write
+
+    `column="result"` Header of the result column
+
+    `delimiter=","` Delimiter of the columns
+    """
+    start = time.perf_counter()
+    reader = csv.reader(source, delimiter=delimiter)
+    writer = csv.writer(target, delimiter=delimiter, lineterminator="\n")
+    rows = 0
+    errors = []
+    header = next(reader, None)
+    if header is not None:
+        writer.writerow(header + [column])
+        run = _runner(a, header)
+        for row in reader:
+            if len(row) == 0:
+                continue
+            result, error = run(row, reader.line_num)
+            if error is not None:
+                errors.append((reader.line_num, error))
+                result = ""
+            writer.writerow(row + [result])
+            rows += 1
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds > 0 else 0.0,
+        "errors": errors
+    }
+
+
+def iter_csv(a, source, delimiter=","):
+    """
+    Evaluate the given AST for each row of the CSV file `source` lazily,
+    like `evaluate_csv`, and yield the results. Empty rows are skipped, the
+    errors of a row are raised as `EvaluationException` with the line
+    number of the row.
+
+    @param
+    ---
+    `a` The AST, or its `program`
+
+    `source` The CSV file object to read
+
+    `delimiter=","` Delimiter of the columns
+    """
+    reader = csv.reader(source, delimiter=delimiter)
+    header = next(reader, None)
+    if header is None:
+        return
+    run = _runner(a, header)
+    for row in reader:
+        if len(row) == 0:
+            continue
+        result, error = run(row, reader.line_num)
+        if error is not None:
+            raise EvaluationException("Line %d: %s" % (reader.line_num, error))
+        yield result
+
+
+def _runner(a, header):
+    """
+    Return a function that evaluates the tree with a row of the header and
+    its line number, and returns the result and None, or None and the
+    message if the row raises an error or gives a complex number
+    """
+    p = a if isinstance(a, program) else program.from_astree(a)
+    index = {name.strip(): i for i, name in enumerate(header)}
+    for v in p.variables:
+        if v not in index:
+            raise EvaluationException("Undefined variable: " + v)
+    columns = [index[v] for v in p.variables]
+    width = max(columns) + 1 if len(columns) > 0 else 0
+    run = p.run
+    def runner(row, line):
+        if len(row) < width:
+            raise EvaluationException("Line %d: expected %d columns, got %d" % (line, width, len(row)))
+        try:
+            value = run([row[i] for i in columns])
+            if isinstance(value, complex):
+                raise EvaluationException("Complex result: " + str(value))
+        except Exception as e:
+            return None, "%s: %s" % (type(e).__name__, e)
+        return value, None
+    return runner
@@ -0,0 +1,328 @@
+"""
+This module evaluates an AST over NumPy arrays of variable values, every
+node of the tree is computed once as an array operation. NumPy is only
+imported when these functions are used.
+"""
+
+
+import os
+import sys
+import contextvars
+import sysconfig
+import tempfile
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from .expr import *
+from .excepts import *
+from .vm import program
+from .compiler import _postorder
+
+
+# Number of elements evaluated at a time by `evaluate_blocks`, the scratch
+# buffers of a block stay in the CPU cache
+BLOCK_SIZE = 8192
+
+
+def _log(x, base, out=None):
+    "Logarithm of x with the given base, the same as `math.log(x, base)`"
+    np = _numpy()
+    out = np.log(x, out=out)
+    out /= np.log(base)
+    return out
+
+
+# numpy_mapper maps the symbols in `symbols` to the names of NumPy ufuncs
+# that compute them element-wise, or to functions that take the same
+# arguments, including `out`
+numpy_mapper = {
+    "+": "add",
+    "-": "subtract",
+    "*": "multiply",
+    "/": "true_divide",
+    "^": "power",
+
+    "max": "maximum",
+    "min": "minimum",
+    "log": _log,
+
+    "sin": "sin",
+    "cos": "cos",
+    "tan": "tan",
+    "asin": "arcsin",
+    "acos": "arccos",
+    "atan": "arctan",
+    "lg": "log10",
+    "ln": "log",
+    "sqrt": "sqrt",
+    "abs": "absolute",
+    "~": "negative"
+}
+
+
+def evaluate_array(a, vars={}):
+    """
+    Evaluate the given AST over arrays, the values of the variables can be
+    NumPy arrays (or anything that converts to float arrays), which are
+    broadcast against each other, and the result is an array. Each node of
+    the tree is computed once for all the values.
+
+    Please notice that NumPy follows floating point rules instead of raising
+    errors like `evaluate`, for example, dividing by zero gives `inf` and
+    `sqrt(-1)` gives `nan`. Functions that are not in `numpy_mapper` are
+    applied element by element.
+
+    @param
+    ---
+    `a` The AST
+
+    `vars={}` The variables dict, for example: `{"x": numpy.arange(10), "y": 2}`
+    """
+    np = _numpy()
+    arrays = {}
+    values = []
+    for n in _postorder(a.root):
+        if n is None:
+            values.append(np.float64(0))
+        elif n.kind == NODE_CONST:
+            values.append(np.float64(n.value))
+        elif n.kind == NODE_VAR:
+            if n.sym not in vars:
+                raise EvaluationException("Undefined variable: " + n.sym)
+            if n.sym not in arrays:
+                arrays[n.sym] = np.asarray(vars[n.sym], dtype=np.float64)
+            values.append(arrays[n.sym])
+        elif n.kind == NODE_UNARY:
+            values[-1] = _ufunc(n.sym)(values[-1])
+        elif n.kind == NODE_BINARY:
+            right = values.pop()
+            values[-1] = _ufunc(n.sym)(values[-1], right)
+        else:
+            raise EvaluationException("Unknown symbol: " + str(n.sym))
+    if len(values) == 0:
+        return np.float64(0)
+    return values[0]
+
+
+def evaluate_blocks(a, vars={}, out=None, block_size=BLOCK_SIZE):
+    """
+    Evaluate the given AST over arrays like `evaluate_array`, but block by
+    block along the first axis of the arrays. Each block is computed in a
+    small pool of scratch buffers, one per register of the `program` of
+    the tree, and the result is written into `out`, so that the memory used
+    does not grow with the length of the arrays. Return `out`.
+
+    @param
+    ---
+    `a` The AST, or its `program`
+
+    `vars={}` The variables dict, for example: `{"x": numpy.arange(10), "y": 2}`
+
+    `out=None` Float64 array for the result, with the broadcast shape of the
+    variables, a new array is created if it is not given
+
+    `block_size=BLOCK_SIZE` Number of elements evaluated at a time
+    """
+    np = _numpy()
+    p = a if isinstance(a, program) else program.from_astree(a)
+    for v in p.variables:
+        if v not in vars:
+            raise EvaluationException("Undefined variable: " + v)
+    inputs = [np.asarray(vars[v], dtype=np.float64) for v in p.variables]
+    shape = np.broadcast_shapes(*(x.shape for x in inputs))
+    if out is None:
+        out = np.empty(shape)
+    elif out.shape != shape or out.dtype != np.float64:
+        raise ValueError("out must be a float64 array of shape %s" % (shape,))
+    # A scalar result is computed as a block of one element
+    result = out.reshape(1) if len(shape) == 0 else out
+    shape = result.shape
+    inputs = [np.broadcast_to(x, shape) for x in inputs]
+    rows = max(1, min(shape[0], block_size // max(1, int(np.prod(shape[1:])))))
+    ops = _ops(p)
+    registers = [np.float64(c) for c in p.consts] + inputs + \
+                [np.empty((rows,) + shape[1:]) for _ in range(p.temps)] + [np.float64(0)]
+    start, end = len(p.consts), len(p.consts) + len(inputs)
+    pool = registers[end:-1]
+    for i in range(0, shape[0], rows):
+        j = min(i + rows, shape[0])
+        r = registers[:]
+        r[start:end] = [x[i:j] for x in inputs]
+        r[end:-1] = [b[:j-i] for b in pool]
+        block = result[i:j]
+        for k, (f, dst, x, y) in enumerate(ops):
+            target = block if k == len(ops) - 1 else r[dst]
+            if y < 0:
+                f(r[x], out=target)
+            else:
+                f(r[x], r[y], out=target)
+        if len(ops) == 0:
+            block[...] = r[p.result]
+    return out
+
+
+def evaluate_threads(a, vars={}, out=None, threads=None, block_size=BLOCK_SIZE):
+    """
+    Evaluate the given AST over arrays like `evaluate_blocks`, with the
+    rows of the arrays split into one contiguous range per thread. NumPy
+    releases the GIL inside its functions, so the threads run on separate
+    cores. Each thread writes its own rows of `out`, so the result does not
+    depend on the number of threads. Return `out`.
+
+    @param
+    ---
+    `a` The AST, or its `program`
+
+    `vars={}` The variables dict, for example: `{"x": numpy.arange(10), "y": 2}`
+
+    `out=None` Float64 array for the result, with the broadcast shape of the
+    variables, a new array is created if it is not given
+
+    `threads=None` Number of threads, the number of CPUs by default
+
+    `block_size=BLOCK_SIZE` Number of elements evaluated at a time by each thread
+    """
+    np = _numpy()
+    p = a if isinstance(a, program) else program.from_astree(a)
+    for v in p.variables:
+        if v not in vars:
+            raise EvaluationException("Undefined variable: " + v)
+    inputs = [np.asarray(vars[v], dtype=np.float64) for v in p.variables]
+    shape = np.broadcast_shapes(*(x.shape for x in inputs))
+    if out is None:
+        out = np.empty(shape)
+    threads = min(threads or os.cpu_count() or 1, shape[0] if len(shape) > 0 else 1)
+    if threads <= 1:
+        return evaluate_blocks(p, dict(zip(p.variables, inputs)), out, block_size)
+    if out.shape != shape or out.dtype != np.float64:
+        raise ValueError("out must be a float64 array of shape %s" % (shape,))
+    inputs = [np.broadcast_to(x, shape) for x in inputs]
+    bounds = [shape[0] * k // threads for k in range(threads + 1)]
+    def run(k):
+        i, j = bounds[k], bounds[k+1]
+        evaluate_blocks(p, {v: x[i:j] for v, x in zip(p.variables, inputs)}, out[i:j], block_size)
+    # The threads run in copies of the context of the caller, so that settings
+    # such as `numpy.errstate` apply to them as well
+    contexts = [contextvars.copy_context() for _ in range(threads)]
+    with ThreadPoolExecutor(threads) as pool:
+        # Consume the results so that exceptions of the threads are raised
+        list(pool.map(lambda k: contexts[k].run(run, k), range(threads)))
+    return out
+
+
+def evaluate_files(a, paths, output, threads=1, block_size=BLOCK_SIZE):
+    """
+    Evaluate the given AST over raw little-endian float64 files, one file
+    per variable, and write the result to the file `output` in the same
+    format. The files are memory-mapped and evaluated block by block like
+    `evaluate_blocks`, so their values are never loaded as a whole or
+    copied into Python objects. Return the result as a `numpy.memmap`, or
+    as an empty array if the files are empty.
+
+    If `output` is one of the input files, the result is written to a
+    temporary file next to it first, which then replaces it.
+
+    @param
+    ---
+    `a` The AST, or its `program`
+
+    `paths` Dict of the variables to the paths of their files, for example:
+    `{"x": "x.f64", "y": "y.f64"}`
+
+    `output` Path of the result file, it is created or overwritten
+
+    `threads=1` Number of threads, see `evaluate_threads`
+
+    `block_size=BLOCK_SIZE` Number of elements evaluated at a time
+    """
+    np = _numpy()
+    p = a if isinstance(a, program) else program.from_astree(a)
+    for v in p.variables:
+        if v not in paths:
+            raise EvaluationException("Undefined variable: " + v)
+    inputs = {v: _map_file(paths[v]) for v in p.variables}
+    shape = np.broadcast_shapes(*(x.shape for x in inputs.values()))
+    target = output
+    if os.path.exists(output) and any(os.path.samefile(output, paths[v]) for v in p.variables):
+        # Opening the output for writing would truncate the input before it is read
+        fd, target = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output)))
+        os.close(fd)
+    try:
+        if 0 in shape:
+            open(target, "wb").close()
+            out = np.zeros(shape, dtype="<f8")
+        else:
+            out = np.memmap(target, dtype="<f8", mode="w+", shape=shape or (1,))
+            evaluate_threads(p, inputs, out.reshape(shape), threads, block_size)
+            out.flush()
+        if target != output:
+            os.replace(target, output)
+    except BaseException:
+        if target != output and os.path.exists(target):
+            os.remove(target)
+        raise
+    return out
+
+
+def _numpy():
+    """
+    Import NumPy on first use. When this package is imported as `ast`, it
+    hides the standard library `ast`, which NumPy needs through `inspect`,
+    so the standard library module is put back while NumPy is imported.
+    """
+    if "numpy" in sys.modules:
+        return sys.modules["numpy"]
+    package = sys.modules.get("ast")
+    if package is None or hasattr(package, "NodeVisitor"):
+        import numpy
+        return numpy
+    sys.modules["ast"] = _stdlib_ast()
+    try:
+        import numpy
+    finally:
+        sys.modules["ast"] = package
+    return numpy
+
+
+def _stdlib_ast():
+    "Load the standard library `ast` module from its file"
+    path = os.path.join(sysconfig.get_paths()["stdlib"], "ast.py")
+    spec = importlib.util.spec_from_file_location("ast", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _map_file(path):
+    "Memory-map a float64 file, an empty file gives an empty array since it cannot be mapped"
+    np = _numpy()
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype="<f8")
+    return np.memmap(path, dtype="<f8", mode="r")
+
+
+def _ufunc(sym):
+    "Return the element-wise function of the symbol"
+    np = _numpy()
+    f = numpy_mapper.get(sym)
+    if f is None:
+        return _elementwise(np.vectorize(symbols[sym], otypes=[np.float64]))
+    if isinstance(f, str):
+        return getattr(np, f)
+    return f
+
+
+def _elementwise(f):
+    "Add the `out` argument to a function that is applied element by element"
+    def function(*args, out=None):
+        if out is None:
+            return f(*args)
+        out[...] = f(*args)
+        return out
+    return function
+
+
+def _ops(p):
+    "Return the instructions of the program with the element-wise functions"
+    funcs = [_ufunc(sym) for sym in p.functions]
+    ops = p.operands
+    return [(funcs[f], ops[3*i], ops[3*i+1], ops[3*i+2]) for i, f in enumerate(p.code)]
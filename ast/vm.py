@@ -0,0 +1,187 @@
+"""
+This module contains `program`, an AST lowered to a linear register
+program, and the interpreter loop that runs it.
+"""
+
+
+import struct
+import sys
+from array import array
+from .expr import *
+from .excepts import *
+from .compiler import _postorder
+
+
+# Header of serialized programs: magic, version and the sizes of the sections
+_HEADER = struct.Struct("<4sBIIIII")
+_MAGIC = b"PEXP"
+_VERSION = 1
+
+
+class program():
+    """
+    A compact linear program that computes the value of an AST.
+
+    The registers are laid out as the constants, followed by the variables
+    and the temporaries. Each instruction calls one function and is stored
+    as one item of `code`, the index of the function in `functions`, and
+    three items of `operands`: the destination register and the registers
+    of the two arguments, the second is -1 for unary functions. The value
+    is left in register `result`.
+
+    Functions are stored by their symbols and resolved from `symbols` when
+    the program is created or loaded, so a program can be serialized with
+    `dumps` and loaded in another process with `loads`.
+    """
+    def __init__(self, code, operands, consts, variables, functions, temps, result):
+        self.code = code
+        self.operands = operands
+        self.consts = consts
+        self.variables = tuple(variables)
+        self.functions = tuple(functions)
+        self.temps = temps
+        self.result = result
+        self._resolve()
+
+    @classmethod
+    def from_astree(cls, a):
+        """
+        Lower the given AST to a program. Raise `EvaluationException`
+        if the tree contains unknown symbols.
+
+        @param
+        ---
+        `a` The AST
+        """
+        order = _postorder(a.root)
+        # Constants are keyed by repr, which tells -0.0 from 0.0 and matches nan
+        consts = {}
+        values = array("d")
+        variables = {}
+        for n in order:
+            value = 0.0 if n is None else n.value
+            if n is None or n.kind == NODE_CONST:
+                if repr(value) not in consts:
+                    consts[repr(value)] = len(values)
+                    values.append(value)
+            elif n.kind == NODE_VAR:
+                variables.setdefault(n.sym, len(variables))
+            elif n.kind != NODE_UNARY and n.kind != NODE_BINARY:
+                raise EvaluationException("Unknown symbol: " + str(n.sym))
+        base = len(consts) + len(variables)
+        functions = {}
+        code = array("H")
+        operands = array("i")
+        stack = []
+        temps = 0
+        for n in order:
+            if n is None:
+                stack.append(consts[repr(0.0)])
+            elif n.kind == NODE_CONST:
+                stack.append(consts[repr(n.value)])
+            elif n.kind == NODE_VAR:
+                stack.append(len(consts) + variables[n.sym])
+            else:
+                second = stack.pop()
+                if n.kind == NODE_BINARY:
+                    first = stack.pop()
+                else:
+                    first, second = second, -1
+                dst = base + len(stack)
+                temps = max(temps, len(stack) + 1)
+                code.append(functions.setdefault(n.sym, len(functions)))
+                operands.extend((dst, first, second))
+                stack.append(dst)
+        result = stack[0] if len(stack) > 0 else -1
+        return cls(code, operands, values, variables, functions, temps, result)
+
+    def run(self, values=()):
+        """
+        Run the program with the values of the variables given in the
+        order of `variables`, and return the result.
+
+        @param
+        ---
+        `values=()` Sequence of the values of the variables
+        """
+        r = self._registers[:]
+        start = len(self.consts)
+        if len(values) != len(self.variables):
+            raise EvaluationException("Expected %d values, got %d" % (len(self.variables), len(values)))
+        r[start:start+len(values)] = map(float, values)
+        for f, dst, a, b in self._ops:
+            if b < 0:
+                r[dst] = f(r[a])
+            else:
+                r[dst] = f(r[a], r[b])
+        return r[self.result]
+
+    def evaluate(self, vars={}):
+        """
+        Run the program with the variables dict, the same as `evaluate`
+        does for `astree`. Raise `EvaluationException` if a value of the
+        variables is missing.
+
+        @param
+        ---
+        `vars={}` The variables dict, for example: `{"x": 10, "y": 12}`
+        """
+        for v in self.variables:
+            if v not in vars:
+                raise EvaluationException("Undefined variable: " + v)
+        return self.run([vars[v] for v in self.variables])
+
+    def dumps(self):
+        """
+        Serialize the program to bytes, see `loads`.
+        """
+        names = "\0".join(self.variables + ("",) + self.functions).encode()
+        sections = [array("H", self.code), array("i", self.operands), array("d", self.consts)]
+        if sys.byteorder == "big":
+            for s in sections:
+                s.byteswap()
+        header = _HEADER.pack(_MAGIC, _VERSION, len(self.code), len(self.consts),
+                              self.temps, self.result + 1, len(names))
+        return header + b"".join(s.tobytes() for s in sections) + names
+
+    @classmethod
+    def loads(cls, data):
+        """
+        Load a program serialized by `dumps`, the functions are resolved
+        from `symbols` of this process.
+
+        @param
+        ---
+        `data` The bytes
+        """
+        magic, version, ncode, nconsts, temps, result, nnames = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a serialized program")
+        offset = _HEADER.size
+        sections = []
+        for typecode, count in (("H", ncode), ("i", 3 * ncode), ("d", nconsts)):
+            s = array(typecode)
+            size = s.itemsize * count
+            s.frombytes(data[offset:offset+size])
+            if sys.byteorder == "big":
+                s.byteswap()
+            sections.append(s)
+            offset += size
+        names = bytes(data[offset:offset+nnames]).decode().split("\0")
+        split = names.index("")
+        functions = names[split+1:]
+        return cls(*sections, names[:split], functions, temps, result - 1)
+
+    def __reduce__(self):
+        return (program.loads, (self.dumps(),))
+
+    def _resolve(self):
+        "Resolve the functions and prepare the registers and instructions to run"
+        funcs = []
+        for sym in self.functions:
+            if sym not in symbols:
+                raise EvaluationException("Unknown symbol: " + sym)
+            funcs.append(symbols[sym])
+        self._registers = list(self.consts) + [0.0] * (len(self.variables) + self.temps) + [0]
+        ops = self.operands
+        self._ops = [(funcs[f], ops[3*i], ops[3*i+1], ops[3*i+2]) for i, f in enumerate(self.code)]
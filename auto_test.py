@@ -1,12 +1,47 @@
 import time
 import sys
 import os
-from ast import ast, expr
+import io
+import contextlib
+import subprocess
+import tempfile
+import math
+import random
+from ast import ast, expr, flat, parallel, stream, dag, incremental, prepared, vector
 
 
 CASES = 1000
 
 
+def shape(n):
+    "Return the symbols of the subtree from the given node as nested tuples"
+    if n is None:
+        return None
+    return (n.sym, shape(n.left), shape(n.right))
+
+
+def outcome(f):
+    """Call `f` and return its result, "nan" for nan so that results can
+    be compared, or the type of the exception that it raises.
+    """
+    try:
+        r = f()
+        return "nan" if r != r else r
+    except Exception as e:
+        return type(e)
+
+
+def report(start, total, wr_list, label="Expression"):
+    "Print the run time, the number of cases and the wrong cases of a test"
+    print("Done. Run time: %s seconds" % (time.time() - start))
+    print("*******************************")
+    print("*TOTAL:", total)
+    print("*WRONG:", len(wr_list))
+    for e in wr_list:
+        print("------%s:" % label, e)
+    print("*******************************")
+
+
 def test_basic(n, accpet=0.0, hide=False, show_err=True, show_wrong=True, e_length=3, e_min=-5, e_max=5):
     """Automatically generates math expressions(Basic operators only)
     and evaluate the result using `ast.evaluate()` and `ast.build()`.
@@ -99,6 +134,853 @@ def test_basic(n, accpet=0.0, hide=False, show_err=True, show_wrong=True, e_leng
     print("*******************************")
 
 
+def test_spans(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) and
+    tokenizes them by `expr.tokenize_spans()` as str, bytes, bytearray and
+    memoryview. The spans must be the same for all of them, `span_text()`
+    must give the symbols of `expr.tokenize()`, `span_value()` the values of
+    the numbers, and the empty spans must be negations at minus signs.
+    Some expressions with known spans are checked as well.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    known = [
+        ("2*-3+x", [(expr.TOKEN_NUM, 0, 1), (expr.TOKEN_OPER, 1, 2), (expr.TOKEN_NUM, 2, 4),
+                    (expr.TOKEN_OPER, 4, 5), (expr.TOKEN_DUMMY, 5, 6)]),
+        ("-(x)", [(expr.TOKEN_OPER, 0, 0), (expr.TOKEN_LEFTB, 1, 2), (expr.TOKEN_DUMMY, 2, 3),
+                  (expr.TOKEN_RIGHTB, 3, 4)]),
+        ("max(-1,2.5)", [(expr.TOKEN_FUNC, 0, 3), (expr.TOKEN_LEFTB, 3, 4), (expr.TOKEN_NUM, 4, 6),
+                         (expr.TOKEN_NUM, 7, 10), (expr.TOKEN_RIGHTB, 10, 11)])
+    ]
+    es = [e for e, _ in known] + [expr.rand_exp(e_length, e_min, e_max, basic_only=False) + "*x-y" for _ in range(n)]
+    wr_list = []
+    start = time.time()
+    for e, spans in known:
+        if expr.tokenize_spans(e) != spans:
+            wr_list.append(e)
+    for e in es:
+        symbols = [t.sym for t in expr.tokenize(e)]
+        expected = expr.tokenize_spans(e)
+        for b in (e, e.encode(), bytearray(e.encode()), memoryview(e.encode())):
+            spans = expr.tokenize_spans(b)
+            texts = [expr.span_text(b, span) for span in spans]
+            values = [expr.span_value(b, span) for span in spans if span[0] == expr.TOKEN_NUM]
+            negations = [span for span in spans if span[1] == span[2]]
+            if spans != expected or texts != symbols or \
+                    values != [float(t) for t, span in zip(texts, spans) if span[0] == expr.TOKEN_NUM] or \
+                    any(t != ("~" if span[1] == span[2] else e[span[1]:span[2]]) for t, span in zip(texts, spans)) or \
+                    any(span[0] != expr.TOKEN_OPER or e[span[1]] != "-" for span in negations):
+                wr_list.append("%s %s" % (type(b).__name__, e))
+    report(start, len(es), wr_list)
+
+
+def test_engines(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) and build
+    them with both the single pass parser and the old postfix engine of
+    `ast.build()`, together with some expressions of negations and nested
+    calls. The two trees must have exactly the same symbols at the same
+    places.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    wr_list = []
+    start = time.time()
+    # Negations after binary operators and calls nested in calls
+    cases = ["2*-sin(x)", "2^-(3)", "2*-x^2", "max(sqrt(2),5)", "min(abs(sin(0)),-cos(1))"]
+    es = cases + [expr.rand_exp(e_length, e_min, e_max, basic_only=False) for _ in range(n)]
+    for e in es:
+        if shape(ast.build(e).root) != shape(ast.build(e, use_postfix=True).root):
+            wr_list.append(e)
+    report(start, len(es), wr_list)
+
+
+def test_compile(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) with
+    variables x and y, and compare the results of the function given by
+    `ast.compile()` and of `prepared.prepared` with the result of
+    `ast.evaluate()`. Cases that raise errors must raise the same errors.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    wr_list = []
+    start = time.time()
+    for _ in range(n):
+        e = expr.rand_exp(e_length, e_min, e_max, basic_only=False) + "*x-y"
+        a = ast.build(e)
+        f = ast.compile(a)
+        p = prepared.prepared(a)
+        x, y = random.uniform(e_min, e_max), random.uniform(e_min, e_max)
+        expected = outcome(lambda: ast.evaluate(a, {"x": x, "y": y}))
+        if expected != outcome(lambda: f(x, y)) or expected != outcome(lambda: p((x, y))) or \
+                expected != outcome(lambda: p.evaluate({"y": y, "x": x})):
+            wr_list.append(e)
+    report(start, n, wr_list)
+
+
+def test_errors():
+    """Build malformed expressions and check the messages of the
+    `ParseException` that they raise. A bracket with nothing in it is
+    empty, but a bracket with two operands and no operator between them
+    is missing an operator. Then build expressions with negated function
+    arguments, which must not raise, and check their values.
+    """
+    cases = [
+        ("()", "Empty bracket: ()"),
+        ("()+1", "Empty bracket: ()"),
+        ("(1,2)", "Missing operator in: (1,2)"),
+        ("((1,2))+3", "Missing operator in: ((1,2))+3"),
+        ("(1)(2)", "Missing operator in: (1)(2)"),
+        ("2(3)", "Missing operator in: 2(3)"),
+        ("x(", "Unmatched bracket: ("),
+        (")", "Unmatched bracket: )"),
+        ("max(1)", "Wrong number of arguments for: max"),
+        ("sin(1,2)", "Wrong number of arguments for: sin"),
+        ("(1+)*2", "Missing operand for: +")
+    ]
+    # Negations that start an argument after the first one are valid
+    valid = [
+        ("max(1,-abs(x))", 1.0),
+        ("max(1,-(2))", 1.0),
+        ("max(1,-2^2)", 1.0),
+        ("log(8,-(-2))", 3.0),
+        ("max(-4,-sin(x)*2)", -2 * math.sin(3))
+    ]
+    wr_list = []
+    start = time.time()
+    for e, message in cases:
+        try:
+            ast.build(e)
+            wr_list.append(e)
+        except ast.ParseException as ex:
+            if str(ex) != message:
+                wr_list.append(e + " " + str(ex))
+    for e, value in valid:
+        try:
+            if ast.evaluate(ast.build(e), {"x": 3}) != value:
+                wr_list.append(e)
+        except Exception as ex:
+            wr_list.append(e + " " + str(ex))
+    report(start, len(cases) + len(valid), wr_list)
+
+
+def test_deep(depth=100000):
+    """Build expressions that are nested `depth` levels deep, on the right,
+    on the left and through unary functions, then evaluate, copy and travel
+    the trees. None of them may raise `RecursionError`.
+
+    `depth` default is 100000, controls how deep the expressions are
+    """
+    cases = [
+        ("(1+" * depth + "1" + ")" * depth, depth + 1, depth + 1),
+        ("(" * depth + "1" + "+1)" * depth, depth + 1, depth + 1),
+        ("sqrt(" * depth + "4" + ")" * depth, 4 ** (0.5 ** depth), depth + 1),
+        ("1^" * depth + "2", 1.0, depth + 1)
+    ]
+    wr_list = []
+    start = time.time()
+    for e, value, levels in cases:
+        a = ast.build(e)
+        b = a.copy()
+        with contextlib.redirect_stdout(io.StringIO()):
+            counts = {len(b.preorder()), len(b.inorder()), len(b.postorder())}
+        if ast.evaluate(a) != value or ast.max_depth(b) != levels or \
+                len(ast.level_order(b)) != levels or len(counts) != 1:
+            wr_list.append(e[:20] + "...")
+    report(start, len(cases), wr_list)
+
+
+def test_parallel(n, rows=100, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) with
+    variables x and y, and compare the results of `parallel.evaluate_many()`
+    over `rows` random bindings with the results of `ast.evaluate()`.
+    Rows that raise errors or give complex numbers must give `nan` and be
+    listed in the errors, or raise `EvaluationException` if the errors are
+    not asked for. Bindings that miss variables or have values that are
+    not numbers must be listed in the errors as well.
+
+    `rows` default is 100, controls the number of bindings of each expression
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    wr_list = []
+    total = 0
+    start = time.time()
+    def result(a, b):
+        try:
+            r = ast.evaluate(a, b)
+            return None if isinstance(r, complex) else r
+        except Exception:
+            return None
+    while total < n:
+        e = expr.rand_exp(e_length, e_min, e_max, basic_only=False) + "*x-y"
+        # Every fifth expression divides by zero at its last row
+        if total % 5 == 0:
+            e += "/(x-%r)" % float(e_max + 1)
+        a = ast.build(e)
+        bindings = [{"x": random.uniform(e_min, e_max), "y": random.uniform(e_min, e_max)} for _ in range(rows)]
+        if total % 5 == 0:
+            bindings[-1]["x"] = float(e_max + 1)
+        expected = [result(a, b) for b in bindings]
+        total += 1
+        errors = []
+        actual = parallel.evaluate_many(a, bindings, processes=2, errors=errors)
+        failed = [i for i, r in enumerate(expected) if r is None]
+        if [i for i, _ in sorted(errors)] != failed or \
+                [r for r, x in zip(actual, expected) if x is not None] != [x for x in expected if x is not None] or \
+                any(actual[i] == actual[i] for i in failed):
+            wr_list.append(e)
+        elif len(failed) > 0:
+            try:
+                parallel.evaluate_many(a, bindings, processes=2)
+                wr_list.append(e)
+            except ast.EvaluationException as ex:
+                if not str(ex).startswith("Row %d: " % failed[0]):
+                    wr_list.append(e)
+    # Bindings that miss a variable or have values that are not numbers
+    errors = []
+    bindings = [{"x": 1, "y": 2}, {"x": 1}, {"x": "a", "y": 2}, {"x": 3, "y": 4}]
+    actual = parallel.evaluate_many(ast.build("x*y"), bindings, processes=2, errors=errors)
+    if actual[0] != 2.0 or actual[3] != 12.0 or actual[1] == actual[1] or actual[2] == actual[2] or \
+            [(i, m.split(":")[0]) for i, m in errors] != [(1, "EvaluationException"), (2, "ValueError")]:
+        wr_list.append("Bad bindings: %r %r" % (actual, errors))
+    report(start, n + 1, wr_list)
+
+
+def test_build_many(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions), breaks
+    some of them, and builds them with `parallel.build_many()`. The trees
+    must have exactly the same symbols at the same places as the trees of
+    `ast.build()`, and the broken expressions must give the same exceptions.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    es = [expr.rand_exp(e_length, e_min, e_max, basic_only=False) for _ in range(n)]
+    for i in range(0, n, 10):
+        es[i] = es[i] + random.choice(["+", "(", ")", "max(1)"])
+    wr_list = []
+    start = time.time()
+    trees = parallel.build_many(es, processes=2)
+    for e, a in zip(es, trees):
+        if outcome(lambda: shape(ast.build(e).root)) != (type(a) if isinstance(a, Exception) else shape(a.root)):
+            wr_list.append(e)
+    report(start, n, wr_list)
+
+
+def test_csv(n, rows=20, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) with
+    variables x and y, writes `rows` random bindings to a CSV file in
+    memory, and compare the results of `stream.evaluate_csv()` with the
+    results of `ast.evaluate()`. Expressions that raise errors are skipped,
+    complex results must be written as empty results.
+
+    `rows` default is 20, controls the number of rows of each file
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    wr_list = []
+    total = 0
+    start = time.time()
+    while total < n:
+        e = expr.rand_exp(e_length, e_min, e_max, basic_only=False) + "*x-y"
+        a = ast.build(e)
+        bindings = [{"x": random.uniform(e_min, e_max), "y": random.uniform(e_min, e_max)} for _ in range(rows)]
+        try:
+            expected = [ast.evaluate(a, b) for b in bindings]
+        except Exception:
+            continue
+        # Complex results are written as empty results
+        expected = ["" if isinstance(r, complex) else str(r) for r in expected]
+        total += 1
+        source = io.StringIO("y,x\n" + "".join("%r,%r\n" % (b["y"], b["x"]) for b in bindings))
+        target = io.StringIO()
+        info = stream.evaluate_csv(a, source, target)
+        lines = target.getvalue().splitlines()
+        if info["rows"] != rows or lines[0] != "y,x,result" or \
+                [line.split(",")[-1] for line in lines[1:]] != expected:
+            wr_list.append(e)
+    report(start, n, wr_list)
+
+
+def test_csv_rows():
+    """Evaluate CSV files with empty rows, rows that can not be evaluated
+    and rows that are too short, by `stream.evaluate_csv()`,
+    `stream.iter_csv()` and the command line with --csv and --output.
+    Empty rows must be skipped, bad rows and rows of complex numbers must
+    give empty results and their line numbers, and short rows must raise
+    errors that name their line numbers.
+    """
+    wr_list = []
+    start = time.time()
+    a = ast.build("x/y")
+    # Line 3 divides by zero, line 5 is empty and skipped
+    data = "x,y\n1,2\n3,0\n5,4\n\n"
+    target = io.StringIO()
+    info = stream.evaluate_csv(a, io.StringIO(data), target)
+    if target.getvalue() != "x,y,result\n1,2,0.5\n3,0,\n5,4,1.25\n":
+        wr_list.append("evaluate_csv rows: " + repr(target.getvalue()))
+    if info["rows"] != 3 or [line for line, _ in info["errors"]] != [3]:
+        wr_list.append("evaluate_csv info: " + repr(info))
+    try:
+        list(stream.iter_csv(a, io.StringIO(data)))
+        wr_list.append("iter_csv bad row did not raise")
+    except Exception as e:
+        if not str(e).startswith("Line 3:"):
+            wr_list.append("iter_csv bad row: " + str(e))
+    # Line 3 gives a complex number
+    b = ast.build("x^y")
+    target = io.StringIO()
+    info = stream.evaluate_csv(b, io.StringIO("x,y\n4,0.5\n-1,0.5\n"), target)
+    if target.getvalue() != "x,y,result\n4,0.5,2.0\n-1,0.5,\n" or [line for line, _ in info["errors"]] != [3]:
+        wr_list.append("evaluate_csv complex: " + repr(target.getvalue()))
+    try:
+        list(stream.iter_csv(b, io.StringIO("x,y\n4,0.5\n-1,0.5\n")))
+        wr_list.append("iter_csv complex did not raise")
+    except Exception as e:
+        if not str(e).startswith("Line 3: EvaluationException: Complex result"):
+            wr_list.append("iter_csv complex: " + str(e))
+    for f in (lambda s: stream.evaluate_csv(a, s, io.StringIO()), lambda s: list(stream.iter_csv(a, s))):
+        try:
+            f(io.StringIO("x,y\n1,2\n\n5\n"))
+            wr_list.append("Short row did not raise")
+        except Exception as e:
+            if str(e) != "Line 4: expected 2 columns, got 1":
+                wr_list.append("Short row: " + str(e))
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ast.py")
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "data.csv")
+        output = os.path.join(directory, "result.csv")
+        with open(source, "w") as f:
+            f.write(data)
+        p = subprocess.run([sys.executable, script, "x*y", "--csv", source], capture_output=True, text=True)
+        if p.returncode != 0 or p.stdout != "x,y,result\n1,2,2.0\n3,0,0.0\n5,4,20.0\n":
+            wr_list.append("CLI --csv: " + repr(p.stdout + p.stderr))
+        p = subprocess.run([sys.executable, script, "x/y", "-c", source, "-o", output], capture_output=True, text=True)
+        with open(output) as f:
+            written = f.read()
+        if p.returncode != 0 or written != "x,y,result\n1,2,0.5\n3,0,\n5,4,1.25\n" or \
+                not p.stderr.startswith("Line 3: ZeroDivisionError"):
+            wr_list.append("CLI --csv -o: " + repr(written + p.stderr))
+        with open(source, "a") as f:
+            f.write("7\n")
+        p = subprocess.run([sys.executable, script, "x*y", "-c", source, "-o", output], capture_output=True, text=True)
+        if p.returncode == 0 or "Line 6: expected 2 columns, got 1" not in p.stderr:
+            wr_list.append("CLI short row: " + repr(p.stderr))
+    report(start, 9, wr_list, "Case")
+
+
+def test_flat(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) with
+    variables x and y, converts their trees to `flat.flattree`, and compare
+    `evaluate()`, `max_depth()`, `level_order()` and the three traversals
+    of the flat trees with the ones of the trees. The flat trees must also
+    give the same trees back by `to_astree()`, and by `loads()` of their
+    `dumps()`. Cases that raise errors must raise the same errors.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    wr_list = []
+    start = time.time()
+    for _ in range(n):
+        e = expr.rand_exp(e_length, e_min, e_max, basic_only=False) + "*x-y"
+        a = ast.build(e)
+        f = flat.flattree.from_astree(a)
+        vars = {"x": random.uniform(e_min, e_max), "y": random.uniform(e_min, e_max)}
+        with contextlib.redirect_stdout(io.StringIO()):
+            orders = (a.preorder(), a.inorder(), a.postorder())
+        if outcome(lambda: f.evaluate(vars)) != outcome(lambda: ast.evaluate(a, vars)) or \
+                f.max_depth() != ast.max_depth(a) or f.level_order() != ast.level_order(a) or \
+                (f.preorder(), f.inorder(), f.postorder()) != orders or \
+                f.to_astree() != a or flat.flattree.loads(f.dumps()).to_astree() != a:
+            wr_list.append(e)
+    report(start, n, wr_list)
+
+
+def test_fold(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) with
+    variables x and y, and compare the results of the trees built with
+    `fold=True`, and of the trees specialized by `ast.specialize()` with
+    y bound, with the results of the trees built without folding.
+    Cases that raise errors must raise the same errors, and the number
+    of nodes removed must be the difference of the sizes of the trees.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    def value(a, x, y):
+        return outcome(lambda: ast.evaluate(a, {"x": x, "y": y}))
+    def size(a):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return len(a.postorder())
+    wr_list = []
+    start = time.time()
+    for _ in range(n):
+        e = "(" + expr.rand_exp(e_length, e_min, e_max, basic_only=False) + ")*x-y+" + \
+            expr.rand_exp(e_length, e_min, e_max, basic_only=False)
+        a = ast.build(e)
+        b = ast.build(e)
+        removed = ast.fold(b)
+        x, y = random.uniform(e_min, e_max), random.uniform(e_min, e_max)
+        c, reduced = ast.specialize(a, {"y": y})
+        if value(a, x, y) != value(b, x, y) or size(a) - size(b) != removed or \
+                value(ast.build(e, fold=True), x, y) != value(a, x, y) or \
+                value(c, x, None) != value(a, x, y) or size(a) - size(c) != reduced:
+            wr_list.append(e)
+    report(start, n, wr_list)
+
+
+def test_dag(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) with
+    variables x and y that repeat a subexpression, and compare the result
+    of `dag.dag` with the result of `ast.evaluate()`. Cases that raise
+    errors must raise the same errors, and the repeated subexpression
+    must be merged.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    wr_list = []
+    start = time.time()
+    for _ in range(n):
+        sub = "(" + expr.rand_exp(e_length, e_min, e_max, basic_only=False) + "*x-y)"
+        e = sub + "/" + sub + "+" + expr.rand_exp(e_length, e_min, e_max, basic_only=False)
+        a = ast.build(e)
+        d = dag.dag.from_astree(a)
+        x, y = random.uniform(e_min, e_max), random.uniform(e_min, e_max)
+        if outcome(lambda: ast.evaluate(a, {"x": x, "y": y})) != outcome(lambda: d.evaluate({"x": x, "y": y})) or \
+                d.info()["shared"] == 0:
+            wr_list.append(e)
+    report(start, n, wr_list)
+
+
+def test_incremental(n, updates=10, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) with
+    variables x and y, changes one of the variables `updates` times with
+    `incremental.incremental.update()`, and compare each result with the
+    result of `ast.evaluate()`. Cases that raise errors must raise the
+    same errors.
+
+    `updates` default is 10, controls the number of updates of each expression
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    wr_list = []
+    start = time.time()
+    for _ in range(n):
+        e = "(" + expr.rand_exp(e_length, e_min, e_max, basic_only=False) + ")*x-y/" + \
+            expr.rand_exp(e_length, e_min, e_max, basic_only=False)
+        a = ast.build(e)
+        vars = {"x": random.uniform(e_min, e_max), "y": random.uniform(e_min, e_max)}
+        try:
+            ev = incremental.incremental(a, vars)
+        except Exception:
+            continue
+        for _ in range(updates):
+            v = random.choice("xy")
+            value = random.uniform(e_min, e_max)
+            actual = outcome(lambda: ev.update({v: value}))
+            if not isinstance(actual, type):
+                vars[v] = value
+            if actual != outcome(lambda: ast.evaluate(a, dict(vars, **{v: value}))) or \
+                    ev.value != ast.evaluate(a, vars):
+                wr_list.append(e)
+                break
+    report(start, n, wr_list)
+
+
+def test_cache(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions), builds each
+    of them twice, once with extra whitespaces, while the parse cache is
+    enabled, and checks the counters of the cache, that modifying a built
+    tree does not modify the cached one, and that the trees are equal to
+    the trees built without the cache. Then checks the eviction by
+    `max_nodes`, `clear_cache()`, and that the cache is cleared when
+    `function_mapper` or `special_number` are modified.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    wr_list = []
+    start = time.time()
+    es = {expr.rand_exp(e_length, e_min, e_max, basic_only=False) for _ in range(n)}
+    expected = {e: ast.build(e) for e in es}
+    ast.enable_cache(max_entries=len(es))
+    for e in es:
+        a = ast.build(e)
+        # Change the root and a leaf, the cached tree must not see either
+        n = a.root
+        n.sym = "q"
+        while not n.is_leaf():
+            n = n.right if n.right is not None else n.left
+        n.sym = "q"
+        if ast.build(" ".join(e)) != expected[e]:
+            wr_list.append(e)
+    info = ast.cache_info()
+    if (info["hits"], info["misses"], info["evictions"], info["entries"]) != (len(es), len(es), 0, len(es)):
+        wr_list.append("Counters: " + repr(info))
+    # Every tree of 3 nodes, so only 2 of them fit
+    ast.enable_cache(max_nodes=6)
+    for e in ("1+2", "3+4", "5+6", "1+2"):
+        ast.build(e)
+    info = ast.cache_info()
+    if (info["hits"], info["misses"], info["evictions"], info["entries"], info["nodes"]) != (0, 4, 2, 2, 6):
+        wr_list.append("max_nodes: " + repr(info))
+    ast.build("1+2+3+4")
+    if ast.cache_info()["entries"] != 2 or ast.cache_info()["nodes"] != 6:
+        wr_list.append("Tree larger than max_nodes: " + repr(ast.cache_info()))
+    ast.clear_cache()
+    info = ast.cache_info()
+    if info["entries"] != 0 or info["nodes"] != 0 or info["misses"] != 5:
+        wr_list.append("clear_cache: " + repr(info))
+    ast.enable_cache()
+    ast.build("pi*sin(x)")
+    pi, sin = expr.special_number["pi"], expr.function_mapper["sin"]
+    try:
+        expr.special_number["pi"] = 3
+        if ast.evaluate(ast.build("pi*sin(x)"), {"x": math.pi / 2}) != 3.0:
+            wr_list.append("special_number")
+        expr.function_mapper["sin"] = lambda x: 2
+        if ast.evaluate(ast.build("pi*sin(x)"), {"x": 0}) != 6.0:
+            wr_list.append("function_mapper")
+    finally:
+        expr.special_number["pi"], expr.function_mapper["sin"] = pi, sin
+    if ast.evaluate(ast.build("pi*sin(x)"), {"x": math.pi / 2}) != math.pi:
+        wr_list.append("Restored")
+    if ast.cache_info()["hits"] != 0:
+        wr_list.append("Not cleared: " + repr(ast.cache_info()))
+    ast.disable_cache()
+    if ast.cache_info() is not None:
+        wr_list.append("disable_cache")
+    report(start, len(es) + 7, wr_list, "Case")
+
+
+def test_result_cache(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(Basic operators only) with
+    variables x and y, adds their symbols into trees one by one with
+    `astree.add()` while the result cache is enabled, and evaluates the
+    tree after each symbol. The results must be the same as the results of
+    `dag.dag`, which has no cache, and the complete trees must give the
+    results of `ast.build()`.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    wr_list = []
+    start = time.time()
+    ast.enable_result_cache(max_entries=n)
+    for _ in range(n):
+        e = expr.rand_exp(e_length, e_min, e_max) + "*x-y"
+        vars = {"x": random.randint(e_min, e_max), "y": random.randint(e_min, e_max)}
+        a = ast.astree()
+        for sym in reversed(expr.postfix(e)):
+            a.add(sym)
+            expected = outcome(lambda: dag.dag.from_astree(a).evaluate(vars))
+            if outcome(lambda: ast.evaluate(a, vars)) != expected:
+                wr_list.append(e)
+                break
+        else:
+            if outcome(lambda: ast.evaluate(a, vars)) != outcome(lambda: ast.evaluate(ast.build(e), vars)):
+                wr_list.append(e)
+    ast.disable_result_cache()
+    report(start, n, wr_list)
+
+
+def test_result_cache_limits():
+    """Check the eviction and the expiration of the result cache: the least
+    recently used result is evicted when the cache is full, a result
+    expires after `ttl` seconds, and a tree that is modified in place after
+    it is cached gets the result of its new structure, also if it is built
+    by hand or holds a subtree of another tree.
+    """
+    wr_list = []
+    start = time.time()
+    a, b, c = ast.build("x+1"), ast.build("x+2"), ast.build("x+3")
+    vars = {"x": 1}
+    ast.enable_result_cache(max_entries=2)
+    for t in (a, b, a, c):
+        ast.evaluate(t, vars)
+    info = ast.result_cache_info()
+    if (info["hits"], info["misses"], info["evictions"], info["entries"]) != (1, 3, 1, 2):
+        wr_list.append("Eviction counters: " + repr(info))
+    # b is the least recently used one and was evicted, a and c are kept
+    ast.evaluate(ast.build("x+1"), vars)
+    ast.evaluate(c, vars)
+    ast.evaluate(b, vars)
+    info = ast.result_cache_info()
+    if (info["hits"], info["misses"], info["evictions"]) != (3, 4, 2):
+        wr_list.append("Least recently used: " + repr(info))
+    a.root.right.sym = "5"
+    if ast.evaluate(a, vars) != 6.0 or ast.evaluate(ast.build("x+1"), vars) != 2.0:
+        wr_list.append("Modified tree")
+    # A tree built by hand, and a tree that holds a subtree of another tree
+    root = ast.node("+", None, ast.node("x"), ast.node("1"))
+    d = ast.astree(root)
+    ast.evaluate(d, vars)
+    root.right.sym = "5"
+    if ast.evaluate(d, vars) != 6.0:
+        wr_list.append("Modified tree built by hand")
+    e = ast.build("x+1")
+    f = ast.astree(ast.node("*", None, e.root, ast.node("2")))
+    ast.evaluate(f, vars)
+    e.root.right.sym = "5"
+    if ast.evaluate(f, vars) != 12.0:
+        wr_list.append("Modified subtree of another tree")
+    ast.enable_result_cache(ttl=0.05)
+    ast.evaluate(b, vars)
+    ast.evaluate(b, vars)
+    time.sleep(0.1)
+    if ast.evaluate(b, vars) != 3.0:
+        wr_list.append("Expired value")
+    info = ast.result_cache_info()
+    if (info["hits"], info["misses"], info["expirations"], info["ttl"]) != (1, 2, 1, 0.05):
+        wr_list.append("Expiration counters: " + repr(info))
+    ast.clear_result_cache()
+    if ast.result_cache_info()["entries"] != 0:
+        wr_list.append("Clear")
+    ast.disable_result_cache()
+    if ast.result_cache_info() is not None:
+        wr_list.append("Disable")
+    report(start, 9, wr_list, "Case")
+
+
+def test_structure(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions), and checks
+    that the trees of the same expression are equal with the same hash,
+    that a tree is no longer equal to its copy after a symbol of the copy
+    is changed, and equal again after it is changed back. Then the trees
+    are deduplicated in a set, which must keep one tree per structure.
+    Trees built by hand, and trees that hold a subtree of another tree,
+    must not keep their old hashes after they are changed.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    wr_list = []
+    start = time.time()
+    es = [expr.rand_exp(e_length, e_min, e_max, basic_only=False) for _ in range(n)]
+    for e in es:
+        a = ast.build(e)
+        b = a.copy()
+        if a != ast.build(e) or hash(a) != hash(ast.build(e)) or a != b:
+            wr_list.append(e)
+            continue
+        leaf = b.root
+        while not leaf.is_leaf():
+            leaf = leaf.right
+        sym = leaf.sym
+        leaf.sym = "z"
+        changed = a != b
+        leaf.sym = sym
+        if not changed or a != b or hash(a) != hash(b):
+            wr_list.append(e)
+    if len({ast.build(e) for e in es}) != len({shape(ast.build(e).root) for e in es}):
+        wr_list.append("Set of trees")
+    # Trees built by hand and trees put into other trees drop their hashes as well
+    root = ast.node("+")
+    root.left = ast.node("x")
+    root.right = ast.node("1")
+    a = ast.astree(root)
+    hash(a)
+    root.right.sym = "5"
+    if a != ast.build("x+5") or hash(a) != hash(ast.build("x+5")):
+        wr_list.append("Tree built by hand")
+    b = ast.build("x+1")
+    c = ast.astree(ast.node("*", None, b.root, ast.node("2")))
+    hash(c)
+    b.root.right.sym = "5"
+    if c != ast.build("(x+5)*2"):
+        wr_list.append("Subtree put into another tree")
+    report(start, n, wr_list)
+
+
+def evaluate_real(a, vars):
+    """Evaluate the tree like `ast.evaluate()`, but return None if it
+    raises errors or any of its subtrees gives a complex number, for
+    example `abs((-2)^0.5)`, where NumPy gives `nan` instead.
+    """
+    try:
+        value = ast.evaluate(a, vars)
+        stack = [a.root]
+        while len(stack) > 0:
+            n = stack.pop()
+            if n is None:
+                continue
+            if isinstance(ast.evaluate(ast.astree(n), vars), complex):
+                return None
+            stack.append(n.left)
+            stack.append(n.right)
+    except Exception:
+        return None
+    return value
+
+
+def test_vector(n, rows=50, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) with
+    variables x and y, together with expressions of `log(x,base)`, `max`,
+    `min` and `~`, and compare the results of `vector.evaluate_array()`
+    over `rows` random values with the results of `ast.evaluate()` for
+    each value. Values where `ast.evaluate()` raises errors or goes
+    through complex numbers are skipped, NumPy gives `nan` or `inf` there.
+
+    `rows` default is 50, controls the number of values of each expression
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    np = vector._numpy()
+    cases = ["log(x,2)+log(y,x)", "max(x,y)-min(x,~y)", "~x*~(y)", "log(abs(x)+1,abs(y)+2)*max(~x,3)"]
+    es = cases + [expr.rand_exp(e_length, e_min, e_max, basic_only=False) + "*x-y" for _ in range(n)]
+    wr_list = []
+    start = time.time()
+    for e in es:
+        a = ast.build(e)
+        x = np.array([random.uniform(e_min, e_max) for _ in range(rows)])
+        y = np.array([random.uniform(e_min, e_max) for _ in range(rows)])
+        with np.errstate(all="ignore"):
+            actual = np.broadcast_to(vector.evaluate_array(a, {"x": x, "y": y}), x.shape)
+        for i in range(rows):
+            expected = evaluate_real(a, {"x": x[i], "y": y[i]})
+            if expected is None:
+                continue
+            if not (math.isclose(expected, actual[i], rel_tol=1e-9, abs_tol=1e-12) or
+                    (expected != expected and actual[i] != actual[i])):
+                wr_list.append(e)
+                break
+    report(start, len(es), wr_list)
+
+
+def test_blocks(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) with
+    variables x and y, and compare the results of `vector.evaluate_blocks()`
+    with the results of `vector.evaluate_array()`, for lengths that the
+    block sizes do not divide, for 2-D values broadcast against rows, and
+    for trees of constants only. The result must be written into the
+    given `out`, and an `out` of a wrong shape must be refused.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    np = vector._numpy()
+    def same(a, vars, shape, block_size):
+        out = np.empty(shape)
+        with np.errstate(all="ignore"):
+            expected = np.broadcast_to(vector.evaluate_array(a, vars), shape)
+            actual = vector.evaluate_blocks(a, vars, out=out, block_size=block_size)
+        return actual is out and np.allclose(actual, expected, rtol=1e-12, equal_nan=True)
+    wr_list = []
+    start = time.time()
+    for _ in range(n):
+        e = expr.rand_exp(e_length, e_min, e_max, basic_only=False)
+        a = ast.build(e + "*x-y")
+        length = random.randint(1, 300)
+        block_size = random.choice([1, 3, 7, 64, length + 5])
+        x = np.array([random.uniform(e_min, e_max) for _ in range(length)])
+        y = np.array([random.uniform(e_min, e_max) for _ in range(length)])
+        x2 = np.array([[random.uniform(e_min, e_max)] * 3 for _ in range(length)])
+        y2 = np.array([random.uniform(e_min, e_max) for _ in range(3)])
+        if not same(a, {"x": x, "y": y}, (length,), block_size) or \
+                not same(a, {"x": x2, "y": y2}, (length, 3), block_size) or \
+                not same(ast.build(e), {"x": x}, (), block_size):
+            wr_list.append(e)
+    try:
+        vector.evaluate_blocks(ast.build("x+1"), {"x": np.zeros(5)}, out=np.empty(4))
+        wr_list.append("out of a wrong shape")
+    except ValueError:
+        pass
+    report(start, n, wr_list)
+
+
+def test_threads(n, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) with
+    variables x and y, and compare the results of `vector.evaluate_threads()`
+    with 1 thread and with 2 to 8 threads, which must be bit-identical,
+    for lengths that the number of threads does not divide and for 2-D
+    values.
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    np = vector._numpy()
+    wr_list = []
+    start = time.time()
+    for _ in range(n):
+        e = expr.rand_exp(e_length, e_min, e_max, basic_only=False) + "*x-y"
+        a = ast.build(e)
+        length = random.randint(1, 300)
+        x = np.array([random.uniform(e_min, e_max) for _ in range(length)])
+        y = np.array([random.uniform(e_min, e_max) for _ in range(length)])
+        x = x if random.random() < 0.5 else np.stack([x, -x], axis=1)
+        threads = random.randint(2, 8)
+        block_size = random.choice([1, 7, 64])
+        with np.errstate(all="ignore"):
+            expected = vector.evaluate_threads(a, {"x": x, "y": y[:, None] if x.ndim == 2 else y}, threads=1)
+            actual = vector.evaluate_threads(a, {"x": x, "y": y[:, None] if x.ndim == 2 else y},
+                                             out=np.empty(x.shape), threads=threads, block_size=block_size)
+        if not np.array_equal(expected, actual, equal_nan=True):
+            wr_list.append(e)
+    report(start, n, wr_list)
+
+
+def test_files(n, rows=50, e_length=3, e_min=-5, e_max=5):
+    """Automatically generates math expressions(All functions) with
+    variables x and y, writes `rows` random values of x and y to
+    little-endian float64 files in a temporary directory, and compare
+    the file written by `vector.evaluate_files()` with the results of
+    `ast.evaluate()` for each row. The result is also written over the
+    file of x, and empty files must give an empty result. Rows where
+    `ast.evaluate()` raises errors or goes through complex numbers are
+    skipped.
+
+    `rows` default is 50, controls the number of values in the files
+
+    `e_length`, `e_min` and `e_max` control the random generated
+    expressions, see `test_basic`
+    """
+    np = vector._numpy()
+    def same(a, x, y, path):
+        actual = np.fromfile(path, dtype="<f8")
+        if len(actual) != rows:
+            return False
+        for i in range(rows):
+            expected = evaluate_real(a, {"x": x[i], "y": y[i]})
+            if expected is None:
+                continue
+            if not (math.isclose(expected, actual[i], rel_tol=1e-9, abs_tol=1e-12) or
+                    (expected != expected and actual[i] != actual[i])):
+                return False
+        return True
+    wr_list = []
+    start = time.time()
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {v: os.path.join(directory, v + ".f64") for v in ("x", "y", "empty", "result")}
+        for _ in range(n):
+            e = expr.rand_exp(e_length, e_min, e_max, basic_only=False) + "*x-y"
+            a = ast.build(e)
+            x = np.array([random.uniform(e_min, e_max) for _ in range(rows)])
+            y = np.array([random.uniform(e_min, e_max) for _ in range(rows)])
+            x.astype("<f8").tofile(paths["x"])
+            y.astype("<f8").tofile(paths["y"])
+            with np.errstate(all="ignore"):
+                vector.evaluate_files(a, {"x": paths["x"], "y": paths["y"]}, paths["result"],
+                                      block_size=random.choice([1, 7, 64]))
+                ok = same(a, x, y, paths["result"])
+                vector.evaluate_files(a, {"x": paths["x"], "y": paths["y"]}, paths["x"])
+            if not ok or not same(a, x, y, paths["x"]):
+                wr_list.append(e)
+        open(paths["empty"], "wb").close()
+        result = vector.evaluate_files(ast.build("x*2"), {"x": paths["empty"]}, paths["result"])
+        if len(result) != 0 or os.path.getsize(paths["result"]) != 0:
+            wr_list.append("Empty file")
+    report(start, n, wr_list)
+
+
 # ============ eval does not support special math funcions therefore, cannot compare the result =============
 
 # def test_complex(n, accpet=0.0, hide=False, show_err=True, show_wrong=True, e_length=3, e_min=-5, e_max=5):
@@ -193,4 +1075,25 @@ def test_basic(n, accpet=0.0, hide=False, show_err=True, show_wrong=True, e_leng
 #     print("*******************************")
 
 
-test_basic(CASES, hide=True, show_wrong=False, show_err=False)
\ No newline at end of file
+test_basic(CASES, hide=True, show_wrong=False, show_err=False)
+test_spans(CASES)
+test_engines(CASES)
+test_compile(CASES)
+test_errors()
+test_deep()
+test_parallel(20)
+test_build_many(CASES)
+test_csv(100)
+test_csv_rows()
+test_flat(CASES)
+test_fold(CASES)
+test_dag(CASES)
+test_incremental(CASES)
+test_cache(CASES)
+test_result_cache(CASES)
+test_result_cache_limits()
+test_structure(CASES)
+test_vector(CASES)
+test_blocks(CASES)
+test_threads(100)
+test_files(100)
@@ -0,0 +1,246 @@
+"""
+Benchmarks for ast. Run a single benchmark by its name, for example:
+```
+python benchmark.py tokens
+```
+or run all of them without arguments.
+"""
+import time
+import sys
+import random
+import tracemalloc
+import os
+from ast import ast, expr, flat, vm, vector
+
+
+def _expressions(n, basic_only=False, seed=0, length=4):
+    "Generate `n` random expressions that can be evaluated to a real number"
+    random.seed(seed)
+    result = []
+    while len(result) < n:
+        e = expr.rand_exp(length, 1, 9, basic_only=basic_only)
+        try:
+            if not isinstance(ast.evaluate(ast.build(e)), complex):
+                result.append(e)
+        except (ValueError, TypeError, ZeroDivisionError, OverflowError):
+            pass
+    return result
+
+
+def _corpus(n, basic_only=False, seed=0):
+    "Join `n` random expressions into one long expression"
+    return "+".join(_expressions(n, basic_only, seed))
+
+
+def _measure(f):
+    "Return the bytes allocated by `f()` that are still alive, and the result"
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = f()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+class _dict_token():
+    "The token layout before `token` had slots, six flags in a `__dict__`"
+    def __init__(self, sym, is_num=False, is_func=False,
+                    is_dummy=False, is_oper=False,
+                    is_leftb=False, is_rightb=False):
+        self.sym = sym
+        self.is_num = is_num
+        self.is_func = is_func
+        self.is_dummy = is_dummy
+        self.is_oper = is_oper
+        self.is_leftb = is_leftb
+        self.is_rightb = is_rightb
+
+
+def bench_tokens(n=2000):
+    """
+    Compare bytes per token of the slotted `token` against the old
+    dict based layout, over the tokens of `n` random expressions.
+    """
+    e = _corpus(n)
+    tokens = expr.tokenize(e)
+    flags = [dict(is_num=t.is_num, is_func=t.is_func, is_dummy=t.is_dummy,
+                  is_oper=t.is_oper, is_leftb=t.is_leftb, is_rightb=t.is_rightb)
+             for t in tokens]
+    syms = [t.sym for t in tokens]
+    old, _ = _measure(lambda: [_dict_token(s, **f) for s, f in zip(syms, flags)])
+    new, _ = _measure(lambda: [expr.token(s, kind=t.kind) for s, t in zip(syms, tokens)])
+    print("Tokens:", len(tokens))
+    print("Bytes per token (dict):  %.1f" % (old / len(tokens)))
+    print("Bytes per token (slots): %.1f" % (new / len(tokens)))
+
+
+def bench_build(n=2000):
+    """
+    Compare the single pass parser of `build` against the old postfix
+    engine, on one expression joined from `n` random expressions.
+    """
+    e = _corpus(n, basic_only=True)
+    for use_postfix in (False, True):
+        start = time.perf_counter()
+        ast.build(e, use_postfix=use_postfix)
+        print("use_postfix=%s: %.4f seconds" % (use_postfix, time.perf_counter() - start))
+
+
+def bench_postfix_tree(sizes=(10**3, 10**4, 10**5, 10**6), add_limit=10**5):
+    """
+    Compare building a tree from postfix symbols with `astree.add` and with
+    `astree.from_postfix`, over chains of `1-2-3-...-n` and `1^2^3^...^n`
+    for every n in `sizes`. `astree.add` is skipped above `add_limit`.
+    """
+    for op in ("-", "^"):
+        for n in sizes:
+            p = expr.postfix(op.join(str(i % 9 + 1) for i in range(n)))
+            start = time.perf_counter()
+            ast.astree.from_postfix(p)
+            fast = time.perf_counter() - start
+            slow = float("nan")
+            if n <= add_limit:
+                start = time.perf_counter()
+                a = ast.astree()
+                for sym in reversed(p):
+                    a.add(sym)
+                slow = time.perf_counter() - start
+            print("chain %s n=%-8d from_postfix: %.4fs  add: %.4fs" % (op, n, fast, slow))
+
+
+def bench_flat(n=2000):
+    """
+    Compare bytes per node and evaluation time of `astree` and `flattree`,
+    on one expression joined from `n` random expressions.
+    """
+    e = _corpus(n)
+    nodes, a = _measure(lambda: ast.build(e))
+    arrays, f = _measure(lambda: flat.flattree.from_astree(a))
+    print("Nodes:", len(f))
+    print("Bytes per node (astree):   %.1f" % (nodes / len(f)))
+    print("Bytes per node (flattree): %.1f" % (arrays / len(f)))
+    for name, run in (("astree", lambda: ast.evaluate(a)), ("flattree", f.evaluate)):
+        start = time.perf_counter()
+        for _ in range(10):
+            run()
+        print("Evaluate %s: %.4f seconds" % (name, (time.perf_counter() - start) / 10))
+
+
+def _bindings(n, seed=0):
+    "Generate `n` random bindings of the variables x and y"
+    random.seed(seed)
+    return [{"x": random.uniform(1, 9), "y": random.uniform(1, 9)} for _ in range(n)]
+
+
+def bench_compile(n=200, calls=500):
+    """
+    Compare `evaluate` against the function from `compile`, for `n` random
+    expressions of `auto_test.py` with variables, each evaluated `calls` times.
+    """
+    for basic_only in (True, False):
+        trees = [ast.build(e + "*x-y") for e in _expressions(n, basic_only)]
+        bindings = _bindings(calls)
+        start = time.perf_counter()
+        for a in trees:
+            for b in bindings:
+                ast.evaluate(a, b)
+        slow = time.perf_counter() - start
+        start = time.perf_counter()
+        for a in trees:
+            f = ast.compile(a)
+            for b in bindings:
+                f(b["x"], b["y"])
+        fast = time.perf_counter() - start
+        print("basic_only=%s evaluate: %.4fs  compile: %.4fs  (%.1fx)" % (basic_only, slow, fast, slow / fast))
+
+
+def bench_vm(n=200, calls=500):
+    """
+    Compare `evaluate` against `vm.program`, for `n` random expressions
+    with all functions and variables, each evaluated `calls` times.
+    """
+    trees = [ast.build(e + "*x-y") for e in _expressions(n, basic_only=False)]
+    bindings = _bindings(calls)
+    start = time.perf_counter()
+    for a in trees:
+        for b in bindings:
+            ast.evaluate(a, b)
+    slow = time.perf_counter() - start
+    start = time.perf_counter()
+    for a in trees:
+        p = vm.program.from_astree(a)
+        for b in bindings:
+            p.run((b["x"], b["y"]))
+    fast = time.perf_counter() - start
+    size = sum(len(vm.program.from_astree(a).dumps()) for a in trees) / len(trees)
+    print("evaluate: %.4fs  vm: %.4fs  (%.1fx)" % (slow, fast, slow / fast))
+    print("Serialized bytes per program: %.1f" % size)
+
+
+def bench_blocks(n=10**7, e="sin(x)^2+cos(y)/sqrt(abs(x*y)+1)"):
+    """
+    Compare the time and the peak memory traced by `tracemalloc` of
+    `vector.evaluate_array`, which makes one temporary array per node,
+    and `vector.evaluate_blocks` into a given `out`, on arrays of `n`
+    elements. Needs NumPy.
+    """
+    numpy = vector._numpy()
+    rng = numpy.random.default_rng(0)
+    x = rng.uniform(1, 9, n)
+    y = rng.uniform(1, 9, n)
+    out = numpy.empty(n)
+    a = ast.build(e)
+    for name, f in (("evaluate_array", lambda: vector.evaluate_array(a, {"x": x, "y": y})),
+                    ("evaluate_blocks", lambda: vector.evaluate_blocks(a, {"x": x, "y": y}, out=out))):
+        tracemalloc.start()
+        start = time.perf_counter()
+        f()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("%s: %.4fs  peak %.1f MB" % (name, elapsed, peak / 2**20))
+
+
+def bench_threads(n=50*10**6, e="sin(x)^2+cos(y)/sqrt(abs(x*y)+1)"):
+    """
+    Time `vector.evaluate_threads` on arrays of `n` elements, from one
+    thread up to the number of CPUs. Needs NumPy.
+    """
+    numpy = vector._numpy()
+    rng = numpy.random.default_rng(0)
+    x = rng.uniform(1, 9, n)
+    y = rng.uniform(1, 9, n)
+    out = numpy.empty(n)
+    p = vm.program.from_astree(ast.build(e))
+    threads = 1
+    base = None
+    while True:
+        start = time.perf_counter()
+        vector.evaluate_threads(p, {"x": x, "y": y}, out=out, threads=threads)
+        elapsed = time.perf_counter() - start
+        base = base or elapsed
+        print("threads=%d: %.4fs  (%.2fx)" % (threads, elapsed, base / elapsed))
+        if threads >= (os.cpu_count() or 1):
+            break
+        threads = min(threads * 2, os.cpu_count())
+
+
+BENCHMARKS = {
+    "tokens": bench_tokens,
+    "build": bench_build,
+    "postfix_tree": bench_postfix_tree,
+    "flat": bench_flat,
+    "compile": bench_compile,
+    "vm": bench_vm,
+    "blocks": bench_blocks,
+    "threads": bench_threads,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print("=====", name, "=====")
+        start = time.time()
+        BENCHMARKS[name]()
+        print("Done. Run time: %s seconds" % (time.time() - start))